@@ -1,25 +1,32 @@
+import os
+from concurrent.futures import CancelledError, TimeoutError
 from flask import Flask, request, jsonify, render_template
 from flask_cors import CORS
-from backend.agent import Agent, MinimaxAgent
-from backend.board import Board
-from backend.game import Game
-from backend.evaluate import basic_eval
+from backend.sessions import GameStore
+from backend.workers import SearchPool
 
 WHITE, BLACK = 0, 1
-white_turn = True
 app = Flask(__name__)
-is_1v1 = True
-minimax = False
-move_count = 0
+# Budget for each AI move; iterative deepening stops at whichever runs out first
+AI_MAX_DEPTH = 20
+AI_TIME_MS = 1000
+# Every game keeps its own transposition table in its worker, so keep them small
+AI_TT_SIZE = 1 << 14
+MAX_GAMES = 1000
+# Searches run in worker processes so games think in parallel across cores
+AI_WORKERS = int(os.environ.get("MICROCHESS_AI_WORKERS", os.cpu_count() or 1))
+# Longest /ai_move waits for a search before telling the client to ask again
+AI_POLL_WAIT_S = 10
 
 CORS(app)
 
+games = GameStore(max_games=MAX_GAMES)
+search_pool = SearchPool(AI_WORKERS, depth=AI_MAX_DEPTH, tt_size=AI_TT_SIZE, time_ms=AI_TIME_MS)
 
-class FrontendAgent(Agent):
-  def __init__(self, color: int, board: Board) -> None:
-    super().__init__(color, board)
 
-g = Game(FrontendAgent, FrontendAgent)
+def unknown_game():
+    return jsonify({"error": "Unknown or expired game, reset to start a new one"}), 404
+
 
 @app.route('/')
 def home():
@@ -27,102 +34,155 @@ def home():
 
 @app.route('/reset_game', methods=['POST'])
 def reset_game():
-    global g, white_turn, minimax
-    white_turn = True
+    data = request.get_json(silent=True) or {}
+    is_1v1 = data.get('is_1v1')
+    session = games.get(data.get('game_id'))
 
-    g = Game(None, None)
-    if not is_1v1:
-        minimax = MinimaxAgent(1, g.board, basic_eval)
-    return jsonify(message="Game state reset successfully!")
+    if session is None:
+        session = games.create(True if is_1v1 is None else is_1v1)
+    else:
+        with session.lock:
+            session.reset(is_1v1)
+    return jsonify(message="Game state reset successfully!", game_id=session.game_id)
 
 @app.route('/change_mode', methods=['GET'])
 def change_mode():
-    global is_1v1
-    is_1v1 = not is_1v1
+    session = games.get(request.args.get('game_id'))
+    if session is None:
+        return unknown_game()
+    with session.lock:
+        session.toggle_mode()
     return jsonify({"message": "Mode changed successfully"}), 200
 
 
 
 @app.route('/move', methods=['POST'])
 def move():
-    global white_turn, move_count
     data = request.json
+    session = games.get(data.get('game_id'))
+    if session is None:
+        return unknown_game()
+    with session.lock:
+        if session.pending is not None:
+            return jsonify({"error": "Waiting for the computer's move"}), 409
+        return play_move(session, data)
+
+
+def play_move(session, data):
+    g = session.game
     old_coor = data.get('old_coor')
     new_coor = data.get('new_coor')
-    curr_pos = []
-    new_pos = []
-    for k in old_coor:
-        curr_pos.append(int(old_coor[k]))
-    for k in new_coor:
-        new_pos.append(int(new_coor[k]))
+    curr_pos = [int(old_coor['row']), int(old_coor['col'])]
+    new_pos = [int(new_coor['row']), int(new_coor['col'])]
     g.flask_move(curr_pos, new_pos)
-    move_count += 1
+    session.move_count += 1
 
-    game_state = g.is_game_over(BLACK if white_turn else WHITE, move_count)
-    king_pos = g.board.pieces["k" if white_turn else "K"][0].get_pos()
+    game_state = g.is_game_over(BLACK if session.white_turn else WHITE, session.move_count)
+    king_pos = g.board.pieces["k" if session.white_turn else "K"][0].get_pos()
     if game_state[0]:
         winner_message = game_state[1]
         return jsonify({"game_over": True, "message": winner_message, "king_position": king_pos, "legal_moves": []}), 200
 
-    checks = g.board.pieces["k" if white_turn else "K"][0].checks
-
-    if len(checks) > 0:
-        if is_1v1:
-            white_turn = not white_turn
+    if g.in_check(BLACK if session.white_turn else WHITE):
+        if session.is_1v1:
+            session.white_turn = not session.white_turn
             return jsonify({"message": "Moved successfully", "in_check": True, "king_position": king_pos}), 200
 
-    if not is_1v1:
-        move_count += 1
-        ai_king_pos = g.board.pieces["k"][0].get_pos()  # Get AI's king position
-        ai_checks = g.board.pieces["k"][0].checks
-        moves = minimax.get_move()
-        curr_pos = moves[1]
-        new_pos = moves[2]
-        g.flask_move(curr_pos, new_pos)
-        game_state = g.is_game_over(WHITE, move_count)
-        print(game_state)
-
-        # Check if Players king is in check after AI move
-        white_king_pos = g.board.pieces["K"][0].get_pos()
-        white_king_checks = g.board.pieces["K"][0].checks
-        # Convert tuples to dictionaries for JSON serialization
-        curr_pos_dict = {"row": curr_pos[0], "col": curr_pos[1]}
-        new_pos_dict = {"row": new_pos[0], "col": new_pos[1]}
-
-        # Return the move as structured JSON
-        return jsonify({
-            "message": "Moved successfully",
-            "ai_move": {
-                "old_coor": curr_pos_dict,
-                "new_coor": new_pos_dict
-            },
-            "ai_in_check": len(ai_checks) > 0,  # True if AI king is in check
-            "ai_king_position": ai_king_pos,  # Add the AI king's position here
-            "ai_game_over": game_state[0],
-            "result_message": game_state[1],
-            "white_king_position": white_king_pos,
-            "white_king_checks": len(white_king_checks) > 0
-
-        }), 200
-
-    white_turn = not white_turn
+    if not session.is_1v1:
+        session.move_count += 1
+        # The reply is collected from /ai_move once a worker has found it
+        # "debug": true in the request asks for the search's stats in /ai_move
+        session.pending = search_pool.submit(session.position(BLACK), session.game_id,
+                                             stats=bool(data.get('debug')))
+        return jsonify({"message": "Moved successfully", "ai_pending": True}), 200
+
+    session.white_turn = not session.white_turn
 
     return jsonify({"message": "Moved successfully"}), 200
 
 
+@app.route('/ai_move', methods=['GET'])
+def ai_move():
+    session = games.get(request.args.get('game_id'))
+    if session is None:
+        return unknown_game()
+    pending = session.pending
+    if pending is None:
+        return jsonify({"error": "No computer move pending"}), 400
+
+    try:
+        wait = float(request.args.get('wait', AI_POLL_WAIT_S))
+    except ValueError:
+        wait = None
+    # Also turns away nan, which no comparison accepts
+    if wait is None or not wait >= 0:
+        return jsonify({"error": "wait must be a non-negative number of seconds"}), 400
+    wait = min(wait, AI_POLL_WAIT_S)
+    try:
+        curr_pos, new_pos, stats = pending.result(timeout=wait)
+    except TimeoutError:
+        return jsonify({"ai_pending": True}), 202
+    except CancelledError:
+        return jsonify({"error": "Game was reset"}), 409
+
+    with session.lock:
+        # Another poll may have collected it, or the game was reset meanwhile
+        if session.pending is not pending:
+            return jsonify({"error": "No computer move pending"}), 409
+        session.pending = None
+        return play_ai_move(session, curr_pos, new_pos, stats)
+
+
+def play_ai_move(session, curr_pos, new_pos, stats=None):
+    g = session.game
+    ai_king_pos = g.board.pieces["k"][0].get_pos()  # Get AI's king position
+    ai_in_check = g.in_check(BLACK)
+    g.flask_move(curr_pos, new_pos)
+    game_state = g.is_game_over(WHITE, session.move_count)
 
+    # Check if Players king is in check after AI move
+    white_king_pos = g.board.pieces["K"][0].get_pos()
+    white_in_check = g.in_check(WHITE)
+    # Convert tuples to dictionaries for JSON serialization
+    curr_pos_dict = {"row": curr_pos[0], "col": curr_pos[1]}
+    new_pos_dict = {"row": new_pos[0], "col": new_pos[1]}
+
+    # Return the move as structured JSON
+    return jsonify({
+        "message": "Moved successfully",
+        "ai_move": {
+            "old_coor": curr_pos_dict,
+            "new_coor": new_pos_dict
+        },
+        "ai_in_check": ai_in_check,  # True if AI king is in check
+        "ai_king_position": ai_king_pos,  # Add the AI king's position here
+        "ai_game_over": game_state[0],
+        "result_message": game_state[1],
+        "white_king_position": white_king_pos,
+        "white_king_checks": white_in_check,
+        # Search stats, only when the move was requested with "debug": true
+        **({"debug": stats} if stats is not None else {})
+
+    }), 200
 
-@app.route('/get_legal_moves/<int:row>/<int:col>', methods=['GET'])
-def get_legal_moves(row, col):
-    piece = g.board.lookup((row, col))
 
-    # Check if it's the correct color's turn
-    if (piece.get_color() == WHITE and not white_turn) or (piece.get_color() == BLACK and white_turn):
-        return jsonify({"error": "Not your turn!", "legal_moves": []}), 400
 
-    # Calculate legal moves based on the given piece and position
-    legal_moves = piece.moves()
 
+@app.route('/get_legal_moves/<int:row>/<int:col>', methods=['GET'])
+def get_legal_moves(row, col):
+    session = games.get(request.args.get('game_id'))
+    if session is None:
+        return unknown_game()
+    # /move and /ai_move change the board and the turn under the lock
+    with session.lock:
+        piece = session.game.board.lookup((row, col))
+        # Check if it's the correct color's turn
+        wrong_turn = piece is not None and (piece.get_color() == WHITE) != session.white_turn
+        # Calculate legal moves based on the given piece and position
+        legal_moves = [] if piece is None or wrong_turn else session.game.moves_from((row, col))
+
+    if wrong_turn:
+        return jsonify({"error": "Not your turn!", "legal_moves": []}), 400
     return jsonify({"legal_moves": legal_moves}), 200
 
 
@@ -1,7 +1,30 @@
+import time
 from board import Board
 from evaluate import *
 from piece import *
+from bitboard import in_check, position
+from tables import POSITIONS
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from zobrist import side_key
+from tablebase import Tablebase, LOSS
+from movecache import MoveCache
+from searchstats import SearchStats
 WHITE, BLACK = 0, 1
+MATE_SCORE = 100000000
+# Tablebase wins score below any mate the search finds itself
+TABLEBASE_WIN = MATE_SCORE // 2
+INFINITY = float("inf")
+MAX_PLY = 64
+# How many nodes to visit between checks of the time and node budget
+CHECK_INTERVAL = 256
+# Captures searched past the horizon, and the slack allowed when a capture
+# can't lift the score to alpha even if it wins the piece for free
+QUIESCENCE_PLIES = 6
+DELTA_MARGIN = 2
+
+
+class SearchTimeout(Exception):
+  pass
 
 class Agent:
   def __init__(self, color: int, board: Board) -> None:
@@ -56,111 +79,410 @@ class HumanAgent(Agent):
 
 
 class MinimaxAgent(Agent):
-  def __init__(self, color: int, board: Board, eval_func) -> None:
+  def __init__(self, color: int, board: Board, eval_func, depth: int = 6, tt_size: int = 1 << 16,
+               time_ms: Optional[int] = None, node_limit: Optional[int] = None,
+               tablebase: Optional[Tablebase] = None, book=None,
+               quiescence_plies: int = QUIESCENCE_PLIES, stats: bool = False,
+               tt: Optional[TranspositionTable] = None) -> None:
     super().__init__(color, board)
     self.eval_func = eval_func
-
-  def apply_move(self, curr_pos_piece, new_pos) -> list[tuple[int, int], any, tuple[int, int], any]:
-    curr_pos = curr_pos_piece.get_pos()
-    new_pos_piece = self.board.lookup(new_pos)
-    data = [curr_pos, curr_pos_piece, new_pos, None]
-
-    self.board.remove(curr_pos)
-    self.board.forget_piece(curr_pos_piece)
-    curr_pos_piece.remove_pos()
-
-    if new_pos_piece is not None:
-      self.board.remove(new_pos)
-      self.board.forget_piece(new_pos_piece)
-      new_pos_piece.remove_pos()
-      data[3] = new_pos_piece
-
-    self.board.place(new_pos, curr_pos_piece)
-    self.board.add_piece(curr_pos_piece)
-    curr_pos_piece.set_pos(new_pos)
-
-    return data
-
-  def undo_move(self, data: list[tuple[int, int], any, tuple[int, int], any]):
-    curr_pos, curr_pos_piece, new_pos, new_pos_piece = data
-
-    self.board.remove(new_pos)
-    self.board.forget_piece(curr_pos_piece)
-    curr_pos_piece.remove_pos()
-
-    if new_pos_piece is not None:
-      self.board.place(new_pos, new_pos_piece)
-      self.board.add_piece(new_pos_piece)
-      new_pos_piece.set_pos(new_pos)
-
-    self.board.place(curr_pos, curr_pos_piece)
-    self.board.add_piece(curr_pos_piece)
-    curr_pos_piece.set_pos(curr_pos)
+    # How far captures are followed past depth 0; 0 evaluates leaves as they are
+    self.quiescence_plies = quiescence_plies
+    # Evaluators can have the board keep running sums for them, see Board.track
+    for name, table in getattr(eval_func, "incremental", {}).items():
+      board.track(name, table)
+    self.book = book if book is not None and len(book) > 0 else None
+    self.tablebase = tablebase if tablebase is not None and len(tablebase) > 0 else None
+    # get_move deepens up to depth, stopping early once time_ms or node_limit runs out
+    self.depth = min(depth, MAX_PLY - 1)
+    self.time_ms = time_ms
+    self.node_limit = node_limit
+    self.deadline = None
+    self.completed_depth = 0
+    self.pv = []
+    self.follow_pv = False
+    # Kept for the whole game so later moves reuse earlier searches; pass tt
+    # to share one table between agents searching the same game
+    self.tt = tt if tt is not None else TranspositionTable(tt_size)
+    # Each iteration of iterative deepening revisits the last one's positions
+    self.move_cache = MoveCache()
+    # Quiet moves that caused a cutoff, two per ply, and a from/to history score
+    self.killers = [[None, None] for _ in range(MAX_PLY)]
+    self.history = [[0] * len(POSITIONS) for _ in POSITIONS]
+    self.nodes = 0
+    # With stats on, get_move leaves a report of its search in search_stats,
+    # see SearchStats.as_dict; self.stats collects it while the search runs
+    self.collect_stats = stats
+    self.stats = None
+    self.search_stats = None
 
   def minimax(self, move_func, depth: int, is_white: bool) -> tuple:
-
-    white_king = self.board.get_piece("K")[0]
-    black_king = self.board.get_piece("k")[0]
-    white_king.checks_and_pins()
-    black_king.checks_and_pins()
-    white_moves = move_func(self.board, WHITE)
-    black_moves = move_func(self.board, BLACK)
-
-    white_moves_len = sum([len(moves) for moves in white_moves.values()])
-    black_moves_len = sum([len(moves) for moves in black_moves.values()])
-
-    # Checkmate
-    if white_moves_len == 0 and len(white_king.get_checks()) > 0:
-      return (-100000000 * depth - 100000000, (None, None))
-    if black_moves_len == 0 and len(black_king.get_checks()) > 0:
-      return (100000000 * depth + 100000000, (None, None))
-
-
-    # Draw
-    if is_white and len(white_moves) == 0:
-      return (0, (None, None))
-    if not is_white and len(black_moves) == 0:
+    """Plain fixed-depth minimax without pruning or the transposition table.
+
+    Kept as a reference to compare node counts and results against search.
+    """
+    self.nodes += 1
+    color = WHITE if is_white else BLACK
+    moves = move_func(self.board, color)
+
+    if len(moves) == 0:
+      # Checkmate
+      if in_check(self.board, color):
+        mate = MATE_SCORE * depth + MATE_SCORE
+        return (-mate if is_white else mate, (None, None))
+      # Draw
       return (0, (None, None))
 
     if depth == 0:
       return (self.eval_func(self.board), (None, None))
 
+    evals = []
+    for move in moves:
+      self.board.push(move)
+      evaluation = self.minimax(move_func, depth - 1, not is_white)
+      self.board.pop()
+      evals.append((evaluation[0], (position(move[0]), position(move[1]))))
+
     if is_white:
-      evals = []
-      for piece in white_moves:
-        for move in white_moves[piece]:
-          data = self.apply_move(piece, move)
-          evaluation = self.minimax(all_moves_by_color_dict, depth - 1, False)
-          self.undo_move(data)
-          evals.append((evaluation[0], (piece.get_pos(), move)))
-      white_king.checks_and_pins()
-      black_king.checks_and_pins()
-      if evals == []:
-        return (0, (None, None))
       return max(evals, key=lambda x: x[0])
+    return min(evals, key=lambda x: x[0])
+
+  def legal_moves(self, board: Board, color: int) -> tuple[tuple[int, int], ...]:
+    """color's legal moves from the move cache, counted in the stats when
+    they are on. negamax and quiescence do the same inline.
+    """
+    if self.stats is None:
+      return self.move_cache.legal_moves(board, color)
+    return self.stats.legal_moves(self.move_cache, board, color)
+
+  def evaluate(self, color: int) -> float:
+    """Score the board from color's point of view.
+    """
+    if self.stats is None:
+      score = self.eval_func(self.board)
+    else:
+      score = self.stats.evaluate(self.eval_func, self.board)
+    return score if color == WHITE else -score
+
+  def order_moves(self, moves: list[tuple[int, int]], hash_move, ply: int) -> list[tuple[int, int]]:
+    """Sort moves by the previous iteration's principal variation, the hash move,
+    captures by MVV-LVA, killers and finally history.
+    """
+    board = self.board
+    killers = self.killers[ply]
+    pv_move = None
+    if self.follow_pv:
+      # Only the first path through the tree walks the old principal variation
+      if ply < len(self.pv) and self.pv[ply] in moves:
+        pv_move = self.pv[ply]
+      else:
+        self.follow_pv = False
+
+    scored = []
+    for move in moves:
+      if move == pv_move:
+        score = 1 << 41
+      elif move == hash_move:
+        score = 1 << 40
+      else:
+        victim = board.lookup(POSITIONS[move[1]])
+        if victim is not None:
+          attacker = board.lookup(POSITIONS[move[0]])
+          score = (1 << 32) + piece_vals[str(victim).lower()] * 100 - piece_vals[str(attacker).lower()]
+        elif move == killers[0]:
+          score = (1 << 31) + 1
+        elif move == killers[1]:
+          score = 1 << 31
+        else:
+          score = self.history[move[0]][move[1]]
+      scored.append((score, move))
+
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [move for _, move in scored]
+
+  def negamax(self, depth: int, alpha: float, beta: float, color: int, ply: int) -> float:
+    """Alpha-beta search returning the score from color's point of view.
+    """
+    self.nodes += 1
+    if self.nodes % CHECK_INTERVAL == 0 and self.completed_depth > 0:
+      self.check_budget()
+    board = self.board
+    key = side_key(board.hash, color)
+    hash_move = None
+    entry = self.tt.probe(key)
+    if entry is not None:
+      hash_move = entry[4]
+      if entry[1] >= depth:
+        bound, score = entry[2], entry[3]
+        if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+          return score
+
+    if self.tablebase is not None:
+      result = self.tablebase.probe(board, color)
+      if result is not None:
+        wdl, dtm = result
+        return wdl * (TABLEBASE_WIN - dtm)
+
+    stats = self.stats
+    if stats is None:
+      moves = self.move_cache.legal_moves(board, color)
+    else:
+      moves = stats.legal_moves(self.move_cache, board, color)
+    if len(moves) == 0:
+      # Checkmate, preferring the quickest one, or stalemate
+      checked = in_check(board, color) if stats is None else stats.in_check(board, color)
+      return -MATE_SCORE * (depth + 1) if checked else 0
+
+    if depth == 0:
+      if self.quiescence_plies > 0:
+        return self.quiescence(moves, alpha, beta, color, 0)
+      score = self.evaluate(color)
+      self.tt.store(key, 0, EXACT, score, None)
+      return score
+
+    alpha_orig = alpha
+    best_score, best_move = -INFINITY, None
+    for move in self.order_moves(moves, hash_move, ply):
+      capture = board.lookup(POSITIONS[move[1]]) is not None
+      board.push(move)
+      score = -self.negamax(depth - 1, -beta, -alpha, 1 - color, ply + 1)
+      board.pop()
+
+      if score > best_score:
+        best_score, best_move = score, move
+        if score > alpha:
+          alpha = score
+      if alpha >= beta:
+        if stats is not None:
+          stats.cutoff(depth)
+        if not capture:
+          killers = self.killers[ply]
+          if killers[0] != move:
+            killers[1], killers[0] = killers[0], move
+          self.history[move[0]][move[1]] += depth * depth
+        break
+
+    if best_score <= alpha_orig:
+      bound = UPPER
+    elif best_score >= beta:
+      bound = LOWER
     else:
-      evals = []
-      for piece in black_moves:
-        for move in black_moves[piece]:
-          data = self.apply_move(piece, move)
-          eval_val = self.minimax(all_moves_by_color_dict, depth - 1, True)
-          self.undo_move(data)
-          evals.append((eval_val[0], (piece.get_pos(), move), str(piece)))
-      white_king.checks_and_pins()
-      black_king.checks_and_pins()
-      if evals == []:
-        return (0, (None, None))
-      return min(evals, key=lambda x: x[0])
+      bound = EXACT
+    self.tt.store(key, depth, bound, best_score, best_move)
+    return best_score
+
+  def quiescence(self, moves: list[tuple[int, int]], alpha: float, beta: float, color: int, qply: int) -> float:
+    """Search captures only until the position is quiet, so leaves aren't
+    scored in the middle of an exchange.
+
+    The side to move may stand pat on the static score unless it is in check,
+    when every evasion is searched. Captures that can't reach alpha even after
+    winning the piece are skipped.
+    """
+    board = self.board
+    stats = self.stats
+    checked = in_check(board, color) if stats is None else stats.in_check(board, color)
+    stand_pat = self.evaluate(color)
+    if qply >= self.quiescence_plies:
+      return stand_pat
+    if not checked:
+      if stand_pat >= beta:
+        if stats is not None:
+          stats.cutoff(0)
+        return stand_pat
+      alpha = max(alpha, stand_pat)
+
+    scored = []
+    for move in moves:
+      victim = board.lookup(POSITIONS[move[1]])
+      if victim is None:
+        if checked:
+          scored.append((0, move))
+        continue
+      value = piece_vals[str(victim).lower()]
+      if not checked and stand_pat + value + DELTA_MARGIN <= alpha:
+        continue
+      attacker = board.lookup(POSITIONS[move[0]])
+      scored.append((value * 100 - piece_vals[str(attacker).lower()], move))
+    scored.sort(key=lambda x: x[0], reverse=True)
+
+    best_score = -INFINITY if checked else stand_pat
+    for _, move in scored:
+      board.push(move)
+      self.nodes += 1
+      if self.nodes % CHECK_INTERVAL == 0 and self.completed_depth > 0:
+        self.check_budget()
+      if stats is None:
+        replies = self.move_cache.legal_moves(board, 1 - color)
+      else:
+        replies = stats.legal_moves(self.move_cache, board, 1 - color)
+      if len(replies) == 0:
+        mated = in_check(board, 1 - color) if stats is None else stats.in_check(board, 1 - color)
+        score = MATE_SCORE if mated else 0
+      else:
+        score = -self.quiescence(replies, -beta, -alpha, 1 - color, qply + 1)
+      board.pop()
+
+      if score > best_score:
+        best_score = score
+        if score > alpha:
+          alpha = score
+      if alpha >= beta:
+        if stats is not None:
+          stats.cutoff(0)
+        break
+    return best_score
+
+  def search(self, depth: int) -> tuple:
+    """Search the root to depth and return (score, best move) for this agent's color.
+    """
+    board = self.board
+    color = self.color
+    key = side_key(board.hash, color)
+    entry = self.tt.probe(key)
+    hash_move = entry[4] if entry is not None else None
+
+    best_score, best_move = -INFINITY, None
+    for move in self.order_moves(self.legal_moves(board, color), hash_move, 0):
+      board.push(move)
+      score = -self.negamax(depth - 1, -INFINITY, -best_score, 1 - color, 1)
+      board.pop()
+      if score > best_score:
+        best_score, best_move = score, move
+
+    if best_move is not None:
+      self.tt.store(key, depth, EXACT, best_score, best_move)
+    return (best_score, best_move)
+
+  def check_budget(self) -> None:
+    if self.node_limit is not None and self.nodes >= self.node_limit:
+      raise SearchTimeout
+    if self.deadline is not None and time.perf_counter() >= self.deadline:
+      raise SearchTimeout
+
+  def principal_variation(self, depth: int) -> list[tuple[int, int]]:
+    """Follow hash moves from the root to recover the expected line of play.
+    """
+    board = self.board
+    color = self.color
+    pv = []
+    seen = set()
+    while len(pv) < depth:
+      key = side_key(board.hash, color)
+      entry = self.tt.probe(key)
+      if entry is None or entry[4] is None or key in seen or entry[4] not in self.legal_moves(board, color):
+        break
+      seen.add(key)
+      pv.append(entry[4])
+      board.push(entry[4])
+      color = 1 - color
+
+    for _ in pv:
+      board.pop()
+    return pv
+
+  def tablebase_move(self) -> Optional[tuple[int, int]]:
+    """Pick the move the tablebase rates best, or None unless it covers every reply.
+
+    Wins go to the quickest mate, losses to the slowest.
+    """
+    if self.tablebase is None:
+      return None
+    board = self.board
+    best_move, best_key = None, None
+    for move in self.move_cache.legal_moves(board, self.color):
+      board.push(move)
+      result = self.tablebase.probe(board, 1 - self.color)
+      board.pop()
+      if result is None:
+        return None
+      # The result is from the opponent's side, so their loss is our win
+      wdl, dtm = result
+      key = (-wdl, -dtm if wdl == LOSS else dtm)
+      if best_key is None or key > best_key:
+        best_move, best_key = move, key
+    return best_move
 
   def get_move(self):
-    move = self.minimax(all_moves_by_color_dict, 3, self.color == 0)
-    return (1, move[1][0], move[1][1])
+    """Search with iterative deepening and return the best move of the deepest
+    iteration that finished within the time and node budget.
+
+    Depth 1 always completes so there is a move to return, unless the side to
+    move has none, when both positions are None. Positions covered by the
+    tablebase or the opening book are answered from them without searching.
+
+    >>> from game import Game
+    >>> from evaluate import basic_eval
+    >>> game = Game(None, None)
+    >>> color = game.load_fen("k2R/4/1K2/4/4 b")
+    >>> MinimaxAgent(color, game.board, basic_eval, depth=3).get_move()
+    (1, None, None)
+    """
+    self.search_stats = None
+    move = self.tablebase_move()
+    source = "tablebase"
+    if move is None and self.book is not None:
+      move = self.book.probe(self.board, self.color)
+      source = "book"
+    if move is not None:
+      if self.collect_stats:
+        self.search_stats = {"source": source, "nodes": 0}
+      return (1, position(move[0]), position(move[1]))
+
+    if not self.collect_stats:
+      return self.deepen()
+    # The search sends its move generation, check tests and evaluations
+    # through self.stats while it is set
+    self.stats = stats = SearchStats()
+    tt_hits = self.tt.hits
+    try:
+      move = self.deepen()
+    finally:
+      self.stats = None
+    self.search_stats = {"source": "search", **stats.as_dict(self.nodes, self.tt.hits - tt_hits)}
+    return move
+
+  def deepen(self):
+    """The iterative deepening loop of get_move.
+    """
+    self.tt.new_search()
+    self.nodes = 0
+    self.killers = [[None, None] for _ in range(MAX_PLY)]
+    for row in self.history:
+      for i in range(len(row)):
+        row[i] //= 2
+    self.deadline = None if self.time_ms is None else time.perf_counter() + self.time_ms / 1000
+    self.completed_depth = 0
+    self.pv = []
+
+    stack_size = len(self.board.move_stack)
+    best_move = None
+    for depth in range(1, self.depth + 1):
+      self.follow_pv = True
+      try:
+        score, move = self.search(depth)
+      except SearchTimeout:
+        # Unwind the moves the interrupted search left on the board
+        while len(self.board.move_stack) > stack_size:
+          self.board.pop()
+        break
+
+      best_move = move
+      self.completed_depth = depth
+      if self.stats is not None:
+        self.stats.iteration(depth, self.nodes)
+      self.pv = self.principal_variation(depth)
+      # Nothing deeper can improve on a forced mate or a single legal reply
+      if abs(score) >= MATE_SCORE or len(self.legal_moves(self.board, self.color)) == 1:
+        break
+
+    if best_move is None:
+      # Checkmated or stalemated, so there is nothing to play
+      return (1, None, None)
+    return (1, position(best_move[0]), position(best_move[1]))
 
 def all_moves_by_color_dict(board: Board, color: int) -> dict:
-    white_king = board.get_piece("K")[0]
-    black_king = board.get_piece("k")[0]
-    white_king.checks_and_pins()
-    black_king.checks_and_pins()
+    # Pieces read their king's checks and pins from the board, found once per position
     all_moves = {}
     for pieces in board.pieces:
       if color == BLACK and pieces.islower():
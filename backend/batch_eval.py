@@ -0,0 +1,301 @@
+"""Vectorized evaluation of many positions at once with NumPy.
+
+Positions are rows of an N x 20 int8 array in the layout of bitboard.encode:
+one square per column, 0 for empty, 1 to 6 for white K Q R B N P and the
+negated codes for black. batch_eval scores every row with the terms of
+evaluate.basic_eval: material, slider and knight mobility, pawn advancement
+and the king mobility term, with the same pseudo-legal mobility, so the two
+give the same scores.
+
+A call costs a few hundred microseconds however small the batch, so it pays
+for scoring positions in bulk rather than inside the search, where quiescence
+only has a handful of positions at a time. The command line scores positions
+offline, splitting them into chunks across processes::
+
+    python batch_eval.py --random 100000
+    python batch_eval.py --fens positions.txt --processes 8
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import *
+import numpy as np
+from evaluate import piece_vals, piece_move_multiplier
+from bitboard import PIECE_CHARS, PIECE_CODES, encode, legal_moves
+from tables import *
+
+KING, QUEEN, ROOK, BISHOP, KNIGHT, PAWN = range(1, 7)
+SQUARE_BITS = 1 << np.arange(NUM_SQUARES, dtype=np.int32)
+
+
+def _lines() -> tuple[list, list]:
+  """Every rank and file, and every diagonal two or more squares long, as lists
+  of squares in walking order.
+  """
+  orthogonal = [[row * COL_SIZE + col for col in range(COL_SIZE)] for row in range(ROW_SIZE)]
+  orthogonal += [[row * COL_SIZE + col for row in range(ROW_SIZE)] for col in range(COL_SIZE)]
+  diagonal = []
+  for step in (1, -1):
+    for row, col in POSITIONS:
+      if 0 <= row - 1 and 0 <= col - step < COL_SIZE:
+        continue
+      line = []
+      while row < ROW_SIZE and 0 <= col < COL_SIZE:
+        line.append(row * COL_SIZE + col)
+        row, col = row + 1, col + step
+      if len(line) > 1:
+        diagonal.append(line)
+  return orthogonal, diagonal
+
+
+class LineKind:
+  """How the pieces on a rank or file, or on a diagonal, see each other.
+
+  Each square of a line is reduced to a state; a whole line is then one code,
+  the states as digits, and everything about sliders along the line is read
+  from tables indexed by that code: the mobility they add to white's score and
+  the squares each side attacks, looking through the enemy king.
+  """
+
+  def __init__(self, movers: dict[str, float], lines: list[list[int]]) -> None:
+    # State 0 is empty; then for each color one state per moving piece, the king, and the rest
+    self.states = np.zeros(14, dtype=np.int32)
+    self.weights = [0.0]
+    self.colors = [None]
+    self.kings = [False]
+    for color, chars in enumerate(PIECE_CHARS):
+      sign = 1 if color == WHITE else -1
+      other = len(self.weights) + len(set(movers.values())) + 1
+      for char in chars:
+        self.states[PIECE_CODES[char] + 6] = other
+      # Movers with the same weight share a state to keep the tables small
+      for weight in sorted(set(movers.values())):
+        for char in movers:
+          if movers[char] == weight:
+            self.states[PIECE_CODES[char if color == WHITE else char.lower()] + 6] = len(self.weights)
+        self.weights.append(sign * weight)
+        self.colors.append(color)
+        self.kings.append(False)
+      self.states[PIECE_CODES[chars[0]] + 6] = len(self.weights)
+      self.weights += [0.0, 0.0]
+      self.colors += [color, color]
+      self.kings += [True, False]
+    self.base = len(self.weights)
+
+    self.groups = []
+    for length in sorted({len(line) for line in lines}):
+      squares = np.array([line for line in lines if len(line) == length], dtype=np.intp)
+      self.groups.append((squares, self.base ** np.arange(length, dtype=np.int32)) + self._tables(squares))
+
+  def _tables(self, squares: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    length = squares.shape[1]
+    codes = np.arange(self.base ** length)
+    digits = [codes // self.base ** i % self.base for i in range(length)]
+    mobility = np.zeros(len(codes))
+    # attacks[color][line, code] is a board mask
+    attacks = np.zeros((2, len(squares), len(codes)), dtype=np.int32)
+    for code in range(len(codes)):
+      states = [int(digits[i][code]) for i in range(length)]
+      for i, state in enumerate(states):
+        if self.weights[state] == 0:
+          continue
+        color = self.colors[state]
+        for step in (1, -1):
+          j = i + step
+          blocked = False
+          while 0 <= j < length:
+            target = states[j]
+            attacks[color, :, code] |= SQUARE_BITS[squares[:, j]]
+            if not blocked and (target == 0 or self.colors[target] != color):
+              mobility[code] += self.weights[state]
+            # Attacks carry on through the enemy king, onto the squares it would flee to
+            if target != 0 and not (self.kings[target] and self.colors[target] != color):
+              break
+            blocked = blocked or target != 0
+            j += step
+    return mobility, attacks
+
+  def scan(self, boards: np.ndarray) -> tuple[np.ndarray, list[np.ndarray]]:
+    """Slider mobility and the board masks each color attacks, per position.
+    """
+    states = self.states[boards.astype(np.intp) + 6]
+    mobility = np.zeros(len(boards))
+    attacks = [np.zeros(len(boards), dtype=np.int32) for _ in (WHITE, BLACK)]
+    for squares, powers, line_mobility, line_attacks in self.groups:
+      codes = (states[:, squares] * powers).sum(axis=2)
+      mobility += line_mobility[codes].sum(axis=1)
+      lines = np.arange(len(squares))
+      for color in (WHITE, BLACK):
+        attacks[color] |= np.bitwise_or.reduce(line_attacks[color][lines, codes], axis=1)
+    return mobility, attacks
+
+
+ORTHOGONAL_LINES, DIAGONAL_LINES = _lines()
+LINE_KINDS = (LineKind({'R': piece_move_multiplier['r'], 'Q': piece_move_multiplier['q']}, ORTHOGONAL_LINES),
+              LineKind({'B': piece_move_multiplier['b'], 'Q': piece_move_multiplier['q']}, DIAGONAL_LINES))
+
+
+def _square_tables() -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+  """Per (code + 6, square) tables: SQUARE_SCORE is the material and pawn
+  advancement a piece is worth there from white's side, STEP_ATTACKS the mask a
+  king, knight or pawn attacks from there and KNIGHT_MOVES a knight's targets.
+  """
+  square_score = np.zeros((14, NUM_SQUARES))
+  step_attacks = np.zeros((14, NUM_SQUARES), dtype=np.int32)
+  knight_moves = np.zeros((14, NUM_SQUARES), dtype=np.int32)
+  for color, chars in enumerate(PIECE_CHARS):
+    sign = 1 if color == WHITE else -1
+    for char in chars:
+      square_score[PIECE_CODES[char] + 6] = sign * piece_vals[char.lower()]
+    for sq, (row, _) in enumerate(POSITIONS):
+      # Pawns score for every row they have advanced
+      advance = ROW_SIZE - 1 - row if color == WHITE else row
+      square_score[sign * PAWN + 6, sq] += sign * 0.3 * advance
+      step_attacks[sign * KING + 6, sq] = KING_ATTACKS[sq]
+      step_attacks[sign * KNIGHT + 6, sq] = KNIGHT_ATTACKS[sq]
+      step_attacks[sign * PAWN + 6, sq] = PAWN_ATTACKS[color][sq]
+      knight_moves[sign * KNIGHT + 6, sq] = KNIGHT_ATTACKS[sq]
+  return square_score, step_attacks, knight_moves
+
+
+SQUARE_SCORE, STEP_ATTACKS, KNIGHT_MOVES = _square_tables()
+KING_MASKS = np.array(KING_ATTACKS, dtype=np.int32)
+# MATERIAL[color][code + 6] is the material value of a piece of that color
+MATERIAL = np.zeros((2, 14))
+for color, chars in enumerate(PIECE_CHARS):
+  for char in chars:
+    MATERIAL[color, PIECE_CODES[char] + 6] = piece_vals[char.lower()]
+# Bit counts of 10-bit numbers, looked up twice per 20-bit mask
+HALF_BITS = NUM_SQUARES // 2
+POPCOUNT = np.array([bin(i).count("1") for i in range(1 << HALF_BITS)], dtype=np.int8)
+
+
+def _popcount(masks: np.ndarray) -> np.ndarray:
+  return POPCOUNT[masks & ((1 << HALF_BITS) - 1)] + POPCOUNT[masks >> HALF_BITS]
+
+
+def positions_array(positions) -> np.ndarray:
+  """Stack encoded positions (bytes or rows) into an N x 20 int8 array.
+  """
+  if isinstance(positions, np.ndarray):
+    return positions.astype(np.int8, copy=False)
+  return np.frombuffer(b"".join(positions), dtype=np.int8).reshape(-1, NUM_SQUARES)
+
+
+def _king_term(king_moves: np.ndarray, own_material: np.ndarray, black_material: np.ndarray) -> np.ndarray:
+  # As in basic_eval, the second case always looks at black's material
+  return np.where((own_material >= 52) & (king_moves == 0), 5,
+                  np.where(black_material <= 51, 4 // np.maximum(king_moves, 1), 0))
+
+
+def batch_eval(positions) -> np.ndarray:
+  """Score each position from white's point of view, like basic_eval.
+
+  >>> from game import Game
+  >>> from evaluate import basic_eval
+  >>> board = Game(None, None).board
+  >>> float(batch_eval([encode(board)])[0]) == basic_eval(board)
+  True
+  """
+  boards = positions_array(positions)
+  index = boards.astype(np.intp) + 6
+  squares = np.arange(NUM_SQUARES)
+  scores = SQUARE_SCORE[index, squares].sum(axis=1)
+  occupied = [((boards > 0) * SQUARE_BITS).sum(axis=1), ((boards < 0) * SQUARE_BITS).sum(axis=1)]
+
+  attacks = [np.bitwise_or.reduce(STEP_ATTACKS[index, squares] * (boards * sign > 0), axis=1)
+             for sign in (1, -1)]
+  for kind in LINE_KINDS:
+    mobility, line_attacks = kind.scan(boards)
+    scores += mobility
+    for color in (WHITE, BLACK):
+      attacks[color] |= line_attacks[color]
+
+  # Knights can land on empty squares or enemy pieces
+  knight_moves = KNIGHT_MOVES[index, squares]
+  scores += piece_move_multiplier['n'] * (_popcount(knight_moves & ~occupied[WHITE][:, None]) * (boards > 0)).sum(axis=1)
+  scores -= piece_move_multiplier['n'] * (_popcount(knight_moves & ~occupied[BLACK][:, None]) * (boards < 0)).sum(axis=1)
+
+  # Each king's mobility counts for the other side
+  white_material = MATERIAL[WHITE][index].sum(axis=1)
+  black_material = MATERIAL[BLACK][index].sum(axis=1)
+  for color, sign in ((WHITE, 1), (BLACK, -1)):
+    king = KING_MASKS[np.argmax(boards == sign * KING, axis=1)]
+    moves = _popcount(king & ~occupied[color] & ~attacks[1 - color])
+    if color == WHITE:
+      scores -= _king_term(moves, white_material, black_material)
+    else:
+      scores += _king_term(moves, black_material, black_material)
+  return scores
+
+
+def score_chunks(boards: np.ndarray, chunk: int, processes: int = 1) -> np.ndarray:
+  """batch_eval over boards chunk rows at a time, with the chunks spread over
+  processes worker processes when there is more than one.
+
+  >>> boards = positions_array(random_positions(10))
+  >>> bool((score_chunks(boards, 3) == batch_eval(boards)).all())
+  True
+  """
+  chunks = [boards[i:i + chunk] for i in range(0, len(boards), chunk)]
+  if len(chunks) == 0:
+    return np.zeros(0)
+  if processes <= 1 or len(chunks) == 1:
+    return np.concatenate([batch_eval(part) for part in chunks])
+  with ProcessPoolExecutor(max_workers=processes) as executor:
+    return np.concatenate(list(executor.map(batch_eval, chunks)))
+
+
+def random_positions(count: int, seed: int = 0, max_plies: int = 40) -> list[bytes]:
+  """Encoded positions sampled from random games from the starting position.
+  """
+  from game import Game
+  rng = random.Random(seed)
+  positions = []
+  while len(positions) < count:
+    board = Game(None, None).board
+    color = WHITE
+    for _ in range(rng.randrange(1, max_plies)):
+      moves = legal_moves(board, color)
+      if len(moves) == 0:
+        break
+      board.push(rng.choice(moves))
+      color = 1 - color
+    positions.append(encode(board))
+  return positions
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description="Score MicroChess positions in bulk")
+  source = parser.add_mutually_exclusive_group(required=True)
+  source.add_argument("--fens", help="file with one FEN per line")
+  source.add_argument("--random", type=int, help="score this many positions from random games")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--chunk", type=int, default=1 << 16, help="positions per batch_eval call")
+  parser.add_argument("--processes", type=int, default=os.cpu_count(), help="processes scoring chunks in parallel")
+  args = parser.parse_args()
+
+  if args.fens:
+    from game import Game
+    game = Game(None, None)
+    positions = []
+    with open(args.fens) as f:
+      for line in f:
+        if line.strip():
+          game.load_fen(line.strip())
+          positions.append(encode(game.board))
+  else:
+    positions = random_positions(args.random, args.seed)
+
+  boards = positions_array(positions)
+  start = time.perf_counter()
+  scores = score_chunks(boards, args.chunk, args.processes or 1)
+  seconds = time.perf_counter() - start
+  print(f"{len(scores)} positions in {seconds:.3f}s ({len(scores) / max(seconds, 1e-9):.0f} positions/sec)")
+  print(f"mean {scores.mean():.2f}, min {scores.min():.2f}, max {scores.max():.2f}")
+
+
+if __name__ == "__main__":
+  main()
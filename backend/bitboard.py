@@ -0,0 +1,245 @@
+"""Bitboard move generation for MicroChess.
+
+The 5x4 board only has 20 squares, so every piece type fits in one int. Square
+(row, col) is bit ``row * COL_SIZE + col``, which makes row 0 (black's back
+rank) the low bits; the masks themselves live in ``tables``. ``Board`` keeps
+one bitboard per FEN character plus an occupancy mask per color, and the
+functions here read those to generate moves without touching ``Piece``
+objects.
+
+Moves are ``(from_square, to_square)`` tuples of square indexes.
+"""
+from typing import *
+from tables import *
+
+PIECE_CHARS = ("KQRBNP", "kqrbnp")
+# Square values used by encode: 1 to 6 for white pieces in PIECE_CHARS order,
+# negated for black
+PIECE_CODES = {char: (index + 1) * (-1 if color == BLACK else 1)
+               for color, chars in enumerate(PIECE_CHARS) for index, char in enumerate(chars)}
+
+
+def squares_of(mask: int) -> Iterator[int]:
+  """Yield the square index of every set bit in mask, lowest first.
+
+  >>> list(squares_of(0b10010))
+  [1, 4]
+  """
+  while mask:
+    low = mask & -mask
+    yield low.bit_length() - 1
+    mask ^= low
+
+
+def _first_blocker(direction: int, sq: int, occupied: int) -> int:
+  blockers = RAY_MASKS[direction][sq] & occupied
+  if not blockers:
+    return -1
+  if POSITIVE[direction]:
+    return (blockers & -blockers).bit_length() - 1
+  return blockers.bit_length() - 1
+
+
+def _ray_attacks(direction: int, sq: int, occupied: int) -> int:
+  ray = RAY_MASKS[direction][sq]
+  blocker = _first_blocker(direction, sq, occupied)
+  if blocker >= 0:
+    ray ^= RAY_MASKS[direction][blocker]
+  return ray
+
+
+def rook_attacks(sq: int, occupied: int) -> int:
+  return (_ray_attacks(0, sq, occupied) | _ray_attacks(1, sq, occupied) |
+          _ray_attacks(2, sq, occupied) | _ray_attacks(3, sq, occupied))
+
+
+def bishop_attacks(sq: int, occupied: int) -> int:
+  return (_ray_attacks(4, sq, occupied) | _ray_attacks(5, sq, occupied) |
+          _ray_attacks(6, sq, occupied) | _ray_attacks(7, sq, occupied))
+
+
+def attackers(board, sq: int, color: int, occupied: int) -> int:
+  """Mask of color's pieces attacking sq when the board holds occupied.
+  """
+  bb = board.bitboards
+  k, q, r, b, n, p = PIECE_CHARS[color]
+  found = (KNIGHT_ATTACKS[sq] & bb[n]) | (KING_ATTACKS[sq] & bb[k]) | \
+      (PAWN_ATTACKS[1 - color][sq] & bb[p])
+  rooks = bb[r] | bb[q]
+  if rooks:
+    found |= rook_attacks(sq, occupied) & rooks
+  bishops = bb[b] | bb[q]
+  if bishops:
+    found |= bishop_attacks(sq, occupied) & bishops
+  return found
+
+
+def attack_map(board, color: int, occupied: int) -> int:
+  """Mask of every square color's pieces attack, including defended pieces.
+  """
+  bb = board.bitboards
+  k, q, r, b, n, p = PIECE_CHARS[color]
+  attacked = 0
+  for sq in squares_of(bb[k]):
+    attacked |= KING_ATTACKS[sq]
+  for sq in squares_of(bb[n]):
+    attacked |= KNIGHT_ATTACKS[sq]
+  for sq in squares_of(bb[p]):
+    attacked |= PAWN_ATTACKS[color][sq]
+  for sq in squares_of(bb[r] | bb[q]):
+    attacked |= rook_attacks(sq, occupied)
+  for sq in squares_of(bb[b] | bb[q]):
+    attacked |= bishop_attacks(sq, occupied)
+  return attacked
+
+
+def attacked_squares(board, color: int) -> int:
+  """Mask of the squares color attacks, looking through the other king, so the
+  king cannot step back along a line it is attacked on.
+
+  >>> from board import Board
+  >>> from piece import Rook, King
+  >>> board = Board(5, 4)
+  >>> board.place((0, 0), Rook(WHITE, (0, 0), board))
+  >>> board.place((2, 0), King(BLACK, (2, 0), board))
+  >>> [POSITIONS[sq] for sq in squares_of(attacked_squares(board, WHITE))]
+  [(0, 1), (0, 2), (0, 3), (1, 0), (2, 0), (3, 0), (4, 0)]
+  """
+  other_king = board.bitboards[PIECE_CHARS[1 - color][0]]
+  return attack_map(board, color, (board.occupancy[WHITE] | board.occupancy[BLACK]) ^ other_king)
+
+
+def king_square(board, color: int) -> int:
+  king = board.bitboards[PIECE_CHARS[color][0]]
+  return king.bit_length() - 1 if king else -1
+
+
+def checkers(board, color: int) -> int:
+  """Mask of enemy pieces giving check to color's king.
+  """
+  ks = king_square(board, color)
+  if ks < 0:
+    return 0
+  return attackers(board, ks, 1 - color, board.occupancy[WHITE] | board.occupancy[BLACK])
+
+
+def in_check(board, color: int) -> bool:
+  return checkers(board, color) != 0
+
+
+def insufficient_material(board) -> bool:
+  """True when the game is drawn for lack of mating material: no rooks are left
+  and one side is down to a single minor piece.
+  """
+  bb = board.bitboards
+  if bb['R'] | bb['r']:
+    return False
+  return (bb['B'] | bb['N']).bit_count() == 1 or (bb['b'] | bb['n']).bit_count() == 1
+
+
+def pinned(board, color: int) -> dict[int, int]:
+  """Map each of color's pinned pieces to the mask of squares it may still move to.
+
+  A pinned piece can only travel along the line between its king and the pinner,
+  capturing the pinner included.
+
+  >>> from board import Board
+  >>> from piece import Rook, King, Bishop
+  >>> board = Board(5, 4)
+  >>> board.place((0, 3), Rook(WHITE, (0, 3), board))
+  >>> board.place((0, 1), King(BLACK, (0, 1), board))
+  >>> board.place((0, 2), Bishop(BLACK, (0, 2), board))
+  >>> pinned(board, BLACK) == {square((0, 2)): 1 << square((0, 2)) | 1 << square((0, 3))}
+  True
+  """
+  pins = {}
+  ks = king_square(board, color)
+  if ks < 0:
+    return pins
+  bb = board.bitboards
+  own = board.occupancy[color]
+  occupied = own | board.occupancy[1 - color]
+  enemy = PIECE_CHARS[1 - color]
+  rooks = bb[enemy[1]] | bb[enemy[2]]
+  bishops = bb[enemy[1]] | bb[enemy[3]]
+
+  for direction in range(len(DIRECTIONS)):
+    sliders = rooks if direction in ORTHOGONAL else bishops
+    if not RAY_MASKS[direction][ks] & sliders:
+      continue
+    shield = _first_blocker(direction, ks, occupied)
+    if shield < 0 or not own >> shield & 1:
+      continue
+    pinner = _first_blocker(direction, shield, occupied)
+    if pinner >= 0 and sliders >> pinner & 1:
+      pins[shield] = BETWEEN[ks][pinner] | 1 << pinner
+
+  return pins
+
+
+def legal_moves(board, color: int) -> list[tuple[int, int]]:
+  """Generate every legal move for color as (from_square, to_square) pairs.
+
+  >>> from game import Game
+  >>> len(legal_moves(Game(None, None).board, WHITE))
+  11
+  """
+  bb = board.bitboards
+  k, q, r, b, n, p = PIECE_CHARS[color]
+  own = board.occupancy[color]
+  enemy = board.occupancy[1 - color]
+  occupied = own | enemy
+  moves = []
+
+  king = bb[k]
+  ks = king.bit_length() - 1 if king else -1
+  allowed = ALL_SQUARES & ~own
+  pins = {}
+
+  if ks >= 0:
+    danger = attacked_squares(board, 1 - color)
+    for to in squares_of(KING_ATTACKS[ks] & allowed & ~danger):
+      moves.append((ks, to))
+
+    checking = attackers(board, ks, 1 - color, occupied)
+    if checking & (checking - 1):
+      return moves
+    if checking:
+      allowed &= checking | BETWEEN[ks][checking.bit_length() - 1]
+    pins = pinned(board, color)
+
+  for sq in squares_of(bb[n]):
+    if sq not in pins:
+      for to in squares_of(KNIGHT_ATTACKS[sq] & allowed):
+        moves.append((sq, to))
+
+  for sq in squares_of(bb[b] | bb[q]):
+    for to in squares_of(bishop_attacks(sq, occupied) & allowed & pins.get(sq, ALL_SQUARES)):
+      moves.append((sq, to))
+
+  for sq in squares_of(bb[r] | bb[q]):
+    for to in squares_of(rook_attacks(sq, occupied) & allowed & pins.get(sq, ALL_SQUARES)):
+      moves.append((sq, to))
+
+  for sq in squares_of(bb[p]):
+    targets = (PAWN_PUSHES[color][sq] & ~occupied) | (PAWN_ATTACKS[color][sq] & enemy)
+    for to in squares_of(targets & allowed & pins.get(sq, ALL_SQUARES)):
+      moves.append((sq, to))
+
+  return moves
+
+
+def encode(board) -> bytes:
+  """The position as one signed byte per square, 0 when empty or PIECE_CODES.
+
+  >>> from game import Game
+  >>> import struct
+  >>> struct.unpack("20b", encode(Game(None, None).board))[:8]
+  (-1, -5, -4, -3, -6, 0, 0, 0)
+  """
+  squares = bytearray(NUM_SQUARES)
+  for char, mask in board.bitboards.items():
+    code = PIECE_CODES[char] & 0xFF
+    for sq in squares_of(mask):
+      squares[sq] = code
+  return bytes(squares)
@@ -1,4 +1,6 @@
 from typing import *
+from zobrist import PIECE_KEYS
+from bitboard import attacked_squares, checkers, pinned, squares_of
 
 
 class Board:
@@ -7,6 +9,56 @@ class Board:
     self.row_size = row_size
     self.col_size = col_size
     self.pieces = {}
+    # One bitboard per FEN character and one occupancy mask per color, kept in
+    # sync by place/remove. Square (row, col) is bit row * col_size + col
+    self.bitboards = dict.fromkeys("KQRBNPkqrbnp", 0)
+    self.occupancy = [0, 0]
+    # Zobrist hash of the pieces on the board, see zobrist.side_key for the side to move
+    self.hash = 0
+    # Undo records of pushed moves:
+    # (from_square, to_square, captured, index, attack_maps, king_states)
+    self.move_stack = []
+    # Per color mask of attacked squares and (checks, pins) of the king, see
+    # attacks and checks_and_pins; None until asked for and reset whenever a
+    # piece moves, while pop brings back the earlier ones
+    self.attack_maps = [None, None]
+    self.king_states = [None, None]
+    # Running sums of per-square tables over the pieces on the board, see track
+    self.scores = {}
+    self.score_tables = {}
+
+  def clear(self) -> None:
+    for row in range(self.row_size):
+      for col in range(self.col_size):
+        self.remove((row, col))
+    self.pieces = {}
+    self.move_stack = []
+
+  def track(self, name: str, table: dict[str, Sequence]) -> None:
+    """Keep scores[name] equal to the sum of table[char][square] over every
+    piece on the board, updated as pieces are placed, removed and moved.
+
+    table holds one value per square for each FEN character.
+
+    >>> from game import Game
+    >>> board = Game(None, None).board
+    >>> board.track("pawns", {char: [1 if char in "Pp" else 0] * 20 for char in "KQRBNPkqrbnp"})
+    >>> board.scores["pawns"]
+    2
+    >>> board.push((16, 4))
+    >>> board.scores["pawns"]
+    1
+    >>> board.pop() and board.scores["pawns"]
+    2
+    """
+    self.score_tables[name] = table
+    total = 0
+    for row in range(self.row_size):
+      for col in range(self.col_size):
+        piece = self.board[row][col]
+        if piece is not None:
+          total += table[str(piece)][row * self.col_size + col]
+    self.scores[name] = total
 
   def is_valid_pos(self, pos: tuple[int, int]) -> bool:
     return 0 <= pos[0] < self.row_size and 0 <= pos[1] < self.col_size
@@ -29,9 +81,29 @@ class Board:
     return self.pieces.get(piece, None)
 
   def place(self, pos: tuple[int, int], piece: any) -> None:
+    if self.board[pos[0]][pos[1]] is not None:
+      self.remove(pos)
     self.board[pos[0]][pos[1]] = piece
+    self.attack_maps = [None, None]
+    self.king_states = [None, None]
+    sq = pos[0] * self.col_size + pos[1]
+    self.bitboards[str(piece)] |= 1 << sq
+    self.occupancy[piece.get_color()] |= 1 << sq
+    self.hash ^= PIECE_KEYS[str(piece)][sq]
+    for name, table in self.score_tables.items():
+      self.scores[name] += table[str(piece)][sq]
 
   def remove(self, pos: tuple[int, int]) -> None:
+    piece = self.board[pos[0]][pos[1]]
+    if piece is not None:
+      self.attack_maps = [None, None]
+      self.king_states = [None, None]
+      sq = pos[0] * self.col_size + pos[1]
+      self.bitboards[str(piece)] &= ~(1 << sq)
+      self.occupancy[piece.get_color()] &= ~(1 << sq)
+      self.hash ^= PIECE_KEYS[str(piece)][sq]
+      for name, table in self.score_tables.items():
+        self.scores[name] -= table[str(piece)][sq]
     self.board[pos[0]][pos[1]] = None
 
   def lookup(self, pos: tuple[int, int]) -> Optional[any]:
@@ -41,6 +113,157 @@ class Board:
     self.place(pos, piece)
     self.add_piece(piece)
 
+  def attacks(self, color: int) -> int:
+    """Mask of the squares color attacks, with the other king seen through as
+    in bitboard.attacked_squares, computed once per position.
+
+    >>> from game import Game
+    >>> from tables import BLACK
+    >>> board = Game(None, None).board
+    >>> board.attacks(BLACK) == attacked_squares(board, BLACK)
+    True
+    >>> board.push((16, 4))
+    >>> board.in_check(BLACK), board.pop() and board.in_check(BLACK)
+    (True, False)
+    """
+    attacks = self.attack_maps[color]
+    if attacks is None:
+      attacks = self.attack_maps[color] = attacked_squares(self, color)
+    return attacks
+
+  def in_check(self, color: int) -> bool:
+    king = self.bitboards["Kk"[color]]
+    return bool(king & self.attacks(1 - color))
+
+  def checks_and_pins(self, color: int) -> tuple[list, dict]:
+    """The pieces checking color's king, and its pinned pieces mapped to the
+    pin's line ("v", "h" or "d") and the pinner's position, found once per
+    position from the bitboards. Treat both as read only.
+
+    >>> from game import Game
+    >>> from tables import BLACK
+    >>> board = Game(None, None).board
+    >>> board.push((16, 4))
+    >>> checks, pins = board.checks_and_pins(BLACK)
+    >>> [str(piece) for piece in checks], pins
+    (['R'], {})
+    >>> board.checks_and_pins(BLACK) is board.checks_and_pins(BLACK)
+    True
+    """
+    state = self.king_states[color]
+    if state is not None:
+      return state
+
+    checks = [self.lookup(divmod(sq, self.col_size)) for sq in squares_of(checkers(self, color))]
+    pins = {}
+    king = self.bitboards["Kk"[color]]
+    if king:
+      king_row, king_col = divmod(king.bit_length() - 1, self.col_size)
+      for sq, line in pinned(self, color).items():
+        pinner = divmod((line & self.occupancy[1 - color]).bit_length() - 1, self.col_size)
+        if pinner[1] == king_col:
+          kind = "v"
+        elif pinner[0] == king_row:
+          kind = "h"
+        else:
+          kind = "d"
+        pins[self.lookup(divmod(sq, self.col_size))] = (kind, pinner)
+    state = self.king_states[color] = (checks, pins)
+    return state
+
+  def push(self, move: tuple[int, int]) -> None:
+    """Make move, a (from_square, to_square) pair, so that pop can take it back.
+
+    Only the captured piece leaves the pieces index. Per-type lists hold one or
+    two pieces, so it is swapped with the last entry and popped, and the undo
+    record keeps its slot to put it back in the same order.
+    """
+    from_sq, to_sq = move
+    from_row, from_col = divmod(from_sq, self.col_size)
+    to_row, to_col = divmod(to_sq, self.col_size)
+    piece = self.board[from_row][from_col]
+    captured = self.board[to_row][to_col]
+    index = -1
+
+    if captured is not None:
+      pieces = self.pieces[str(captured)]
+      index = pieces.index(captured)
+      pieces[index] = pieces[-1]
+      pieces.pop()
+      self.bitboards[str(captured)] ^= 1 << to_sq
+      self.occupancy[captured.get_color()] ^= 1 << to_sq
+      self.hash ^= PIECE_KEYS[str(captured)][to_sq]
+      captured.remove_pos()
+
+    self.board[from_row][from_col] = None
+    self.board[to_row][to_col] = piece
+    keys = PIECE_KEYS[str(piece)]
+    self.bitboards[str(piece)] ^= 1 << from_sq | 1 << to_sq
+    self.occupancy[piece.get_color()] ^= 1 << from_sq | 1 << to_sq
+    self.hash ^= keys[from_sq] ^ keys[to_sq]
+    piece.set_pos((to_row, to_col))
+    if self.score_tables:
+      self._update_scores(str(piece), from_sq, to_sq, captured)
+
+    self.move_stack.append((from_sq, to_sq, captured, index, self.attack_maps, self.king_states))
+    self.attack_maps = [None, None]
+    self.king_states = [None, None]
+
+  def pop(self) -> tuple[int, int]:
+    """Take back the last pushed move and return it.
+
+    >>> from game import Game
+    >>> board = Game(None, None).board
+    >>> before = str(board)
+    >>> board.push((16, 4))
+    >>> str(board), board.pieces['p']
+    ('knbr/R3/4/3P/1BNK', [])
+    >>> board.pop()
+    (16, 4)
+    >>> str(board) == before and len(board.pieces['p']) == 1
+    True
+    """
+    from_sq, to_sq, captured, index, self.attack_maps, self.king_states = self.move_stack.pop()
+    from_row, from_col = divmod(from_sq, self.col_size)
+    to_row, to_col = divmod(to_sq, self.col_size)
+    piece = self.board[to_row][to_col]
+
+    self.board[from_row][from_col] = piece
+    self.board[to_row][to_col] = captured
+    keys = PIECE_KEYS[str(piece)]
+    self.bitboards[str(piece)] ^= 1 << from_sq | 1 << to_sq
+    self.occupancy[piece.get_color()] ^= 1 << from_sq | 1 << to_sq
+    self.hash ^= keys[from_sq] ^ keys[to_sq]
+    piece.set_pos((from_row, from_col))
+    if self.score_tables:
+      self._update_scores(str(piece), to_sq, from_sq, captured, undo=True)
+
+    if captured is not None:
+      pieces = self.pieces[str(captured)]
+      if index == len(pieces):
+        pieces.append(captured)
+      else:
+        pieces.append(pieces[index])
+        pieces[index] = captured
+      self.bitboards[str(captured)] ^= 1 << to_sq
+      self.occupancy[captured.get_color()] ^= 1 << to_sq
+      self.hash ^= PIECE_KEYS[str(captured)][to_sq]
+      captured.set_pos((to_row, to_col))
+
+    return (from_sq, to_sq)
+
+  def _update_scores(self, char: str, from_sq: int, to_sq: int, captured, undo: bool = False) -> None:
+    captured_char = str(captured) if captured is not None else None
+    # The captured piece stands on the square the move goes to, or comes back to when undone
+    captured_sq = from_sq if undo else to_sq
+    scores = self.scores
+    for name, table in self.score_tables.items():
+      values = table[char]
+      delta = values[to_sq] - values[from_sq]
+      if captured_char is not None:
+        delta += table[captured_char][captured_sq] if undo else -table[captured_char][captured_sq]
+      scores[name] += delta
+
   def __str__(self) -> str:
     """Converts board state to FEN string for pieces only and expects pieces to have __str__ defined
 
@@ -77,13 +300,26 @@ class Board:
 
       print(row_string)
 
-  def copy(self):
+  def copy(self) -> "Board":
+    """A board with the same position and its own pieces, so moves made on
+    either board leave the other alone. The copy starts with no moves to pop.
+
+    >>> from game import Game
+    >>> board = Game(None, None).board
+    >>> copied = board.copy()
+    >>> copied.push((16, 4))
+    >>> str(board), board.lookup((4, 0)).board is board
+    ('knbr/p3/4/3P/RBNK', True)
+    >>> copied.hash == board.hash, copied.lookup((1, 0)).board is copied
+    (False, True)
+    """
     copied_board = Board(self.row_size, self.col_size)
     for i in range(self.row_size):
       for j in range(self.col_size):
         piece = self.lookup((i, j))
         if piece is not None:
-          copied_board.place((i, j), piece)
-          copied_board.add_piece(piece)  # Update the pieces dictionary in the copied board
+          copied_board.add_piece_place_piece((i, j), type(piece)(piece.get_color(), (i, j), copied_board))
 
+    for name, table in self.score_tables.items():
+      copied_board.track(name, table)
     return copied_board
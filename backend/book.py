@@ -0,0 +1,114 @@
+"""Opening book built from the starting position.
+
+Every game starts from STARTING_FEN, so the first few plies can be searched
+deeply once, offline, and replayed instantly afterwards. The book maps the
+Zobrist key of a position (side to move included) to the move to play there.
+
+The file is a short header followed by entries sorted by key, each a 64-bit key
+and the from and to squares of the move::
+
+    python book.py --plies 6 --depth 8
+"""
+import argparse
+import os
+import struct
+from typing import *
+from game import Game
+from agent import MinimaxAgent
+from evaluate import basic_eval
+from bitboard import legal_moves
+from tables import square, WHITE, BLACK
+from zobrist import side_key
+
+MAGIC = b"MCBK"
+VERSION = 1
+ENTRY = struct.Struct("<QBB")
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.mcbk")
+
+
+class OpeningBook:
+  """Position key to move lookup, loaded from a book file when one exists.
+  """
+
+  def __init__(self, path: Optional[str] = BOOK_PATH) -> None:
+    self.entries = {}
+    if path is not None and os.path.exists(path):
+      self.load(path)
+
+  def __len__(self) -> int:
+    return len(self.entries)
+
+  def load(self, path: str) -> None:
+    with open(path, "rb") as f:
+      data = f.read()
+    if data[:4] != MAGIC or data[4] != VERSION:
+      raise ValueError(f"{path} is not a MicroChess opening book")
+    for key, from_sq, to_sq in ENTRY.iter_unpack(data[5:]):
+      self.entries[key] = (from_sq, to_sq)
+
+  def save(self, path: str) -> None:
+    with open(path, "wb") as f:
+      f.write(MAGIC + bytes([VERSION]))
+      for key in sorted(self.entries):
+        f.write(ENTRY.pack(key, *self.entries[key]))
+
+  def probe(self, board, color: int) -> Optional[tuple[int, int]]:
+    """The book move for color to move, if the position is in the book and the move is legal.
+    """
+    move = self.entries.get(side_key(board.hash, color))
+    if move is not None and move in legal_moves(board, color):
+      return move
+    return None
+
+
+def build(plies: int, depth: int, time_ms: Optional[int] = None) -> OpeningBook:
+  """Search every position within plies of the start where the book side is to move.
+
+  The book side's replies follow only its searched move, while the other side
+  tries every legal move, so the book covers any opponent for both colors.
+  """
+  book = OpeningBook(None)
+  board = Game(None, None).board
+  agents = [MinimaxAgent(color, board, basic_eval, depth=depth, time_ms=time_ms) for color in (WHITE, BLACK)]
+  # Shallowest ply each (key, book side) pair was expanded at
+  expanded = {}
+
+  def visit(color: int, ply: int, book_color: int) -> None:
+    key = side_key(board.hash, color)
+    if ply >= plies or expanded.get((key, book_color), plies) <= ply:
+      return
+    expanded[(key, book_color)] = ply
+
+    if color == book_color:
+      if key not in book.entries:
+        _, curr_pos, new_pos = agents[color].get_move()
+        book.entries[key] = (square(curr_pos), square(new_pos))
+      follow = [book.entries[key]]
+    else:
+      follow = legal_moves(board, color)
+
+    for move in follow:
+      board.push(move)
+      visit(1 - color, ply + 1, book_color)
+      board.pop()
+
+  for book_color in (WHITE, BLACK):
+    visit(WHITE, 0, book_color)
+  return book
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description="Build the MicroChess opening book")
+  parser.add_argument("--plies", type=int, default=6, help="how many plies from the start to cover")
+  parser.add_argument("--depth", type=int, default=8, help="search depth for each book move")
+  parser.add_argument("--time-ms", type=int, default=None, help="optional time budget per book move")
+  parser.add_argument("--out", default=BOOK_PATH, help="file to write the book to")
+  args = parser.parse_args()
+
+  book = build(args.plies, args.depth, args.time_ms)
+  book.save(args.out)
+  print(f"{len(book)} positions -> {args.out}")
+
+
+if __name__ == "__main__":
+  main()
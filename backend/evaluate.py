@@ -1,73 +1,122 @@
 from board import *
+from bitboard import squares_of, rook_attacks, bishop_attacks, attack_map
+from tables import KNIGHT_ATTACKS, KING_ATTACKS, NUM_SQUARES, ROW_SIZE, COL_SIZE, WHITE, BLACK
 
 piece_vals = {'k': 50, 'q': 9, 'r': 5, 'b': 3, 'n': 3, 'p': 1}
 piece_move_multiplier = {'q': 0.2, 'r': 0.2, 'b': 0.1, 'n': 0.1}
+# Scores are cached by the position's Zobrist hash; the side to move doesn't matter
+EVAL_CACHE_SIZE = 1 << 16
+_eval_cache = [None] * EVAL_CACHE_SIZE
+
+
+def _square_table(value: Callable[[str, int], int]) -> dict[str, tuple]:
+  return {char: tuple(value(char, sq) for sq in range(NUM_SQUARES)) for char in "KQRBNPkqrbnp"}
+
+
+# Running sums basic_eval reads from boards that track them, see Board.track:
+# each side's material and how many rows its pawns have advanced
+INCREMENTAL_TABLES = {
+    "white_material": _square_table(lambda char, sq: piece_vals[char.lower()] if char.isupper() else 0),
+    "black_material": _square_table(lambda char, sq: piece_vals[char] if char.islower() else 0),
+    "white_pawn_rows": _square_table(lambda char, sq: ROW_SIZE - 1 - sq // COL_SIZE if char == 'P' else 0),
+    "black_pawn_rows": _square_table(lambda char, sq: sq // COL_SIZE if char == 'p' else 0),
+}
 
 
 def basic_eval(board: Board) -> int:
-  white_val, black_val = 0, 0
+  """Score the board from white's point of view, remembering recent positions.
+
+  >>> from game import Game
+  >>> round(basic_eval(Game(None, None).board), 2)
+  0.0
+  """
+  index = board.hash & (EVAL_CACHE_SIZE - 1)
+  entry = _eval_cache[index]
+  if entry is not None and entry[0] == board.hash:
+    return entry[1]
+  score = mobility_eval(board)
+  _eval_cache[index] = (board.hash, score)
+  return score
+
+
+# MinimaxAgent has the board track these for basic_eval
+basic_eval.incremental = INCREMENTAL_TABLES
+
 
-  for piece, value in piece_vals.items():
-    if piece.upper() in board.pieces:
-      white_val += value * len(board.pieces[piece.upper()])
-    if piece.lower() in board.pieces:
-      black_val += value * len(board.pieces[piece.lower()])
+def mobility_eval(board: Board) -> int:
+  """Material, mobility and pawn advancement, with mobility counted from
+  pseudo-legal attacks: each piece's reachable squares not held by its own side.
+
+  Material and pawn advancement come from the board's running sums when it
+  tracks INCREMENTAL_TABLES, so only the mobility terms are recomputed.
+  """
+  bb = board.bitboards
+  occupancy = board.occupancy
+  occupied = occupancy[WHITE] | occupancy[BLACK]
+  scores = board.scores
+  if "white_pawn_rows" in scores:
+    white_val, black_val = scores["white_material"], scores["black_material"]
+    white_pawn_rows, black_pawn_rows = scores["white_pawn_rows"], scores["black_pawn_rows"]
+  else:
+    white_val, black_val = 0, 0
+    for piece, value in piece_vals.items():
+      white_val += value * bb[piece.upper()].bit_count()
+      black_val += value * bb[piece].bit_count()
+    white_pawn_rows = sum(board.row_size - 1 - sq // board.col_size for sq in squares_of(bb['P']))
+    black_pawn_rows = sum(sq // board.col_size for sq in squares_of(bb['p']))
 
   white_piece_val = white_val
   black_piece_val = black_val
 
-  if 'r' in board.pieces:
-    for rook in board.pieces['r']:
-      black_val += len(rook.moves()) * 0.2
-  if 'R' in board.pieces:
-    for rook in board.pieces['R']:
-      white_val += len(rook.moves()) * 0.2
-
-  if 'q' in board.pieces:
-    for queen in board.pieces['q']:
-      black_val += len(queen.moves()) * 0.2
-  if 'Q' in board.pieces:
-    for queen in board.pieces['q']:
-      white_val += len(queen.moves()) * 0.2
-
-  if 'n' in board.pieces:
-    for knight in board.pieces['n']:
-      black_val += len(knight.moves()) * 0.1
-  if 'N' in board.pieces:
-    for knight in board.pieces['N']:
-      white_val += len(knight.moves()) * 0.1
-
-  if 'b' in board.pieces:
-    for bishop in board.pieces['b']:
-      black_val += len(bishop.moves()) * 0.1
-  if 'B' in board.pieces:
-    for bishop in board.pieces['B']:
-      white_val += len(bishop.moves()) * 0.1
-
-  if 'p' in board.pieces:
-    for pawn in board.pieces['p']:
-      black_val += pawn.get_pos()[0] * 0.3
-  if 'P' in board.pieces:
-    for pawn in board.pieces['P']:
-      white_val += (board.row_size - 1 - pawn.get_pos()[0]) * 0.3
-
-  if 'k' in board.pieces:
-    for king in board.pieces['k']:
-      moves = king.moves()
-      if black_piece_val >= 52 and len(moves) == 0:
-        white_val += 5
-      elif black_piece_val <= 51:
-        white_val += int(4 * 1/len(moves))
-  if 'K' in board.pieces:
-    for king in board.pieces['K']:
-      moves = king.moves()
-      if white_piece_val >= 52 and len(moves) == 0:
-        black_val += 5
-      elif black_piece_val <= 51:
-        black_val += int(4 * 1/len(moves))
+  for sq in squares_of(bb['r']):
+    black_val += (rook_attacks(sq, occupied) & ~occupancy[BLACK]).bit_count() * 0.2
+  for sq in squares_of(bb['R']):
+    white_val += (rook_attacks(sq, occupied) & ~occupancy[WHITE]).bit_count() * 0.2
+
+  for sq in squares_of(bb['q']):
+    black_val += ((rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)) & ~occupancy[BLACK]).bit_count() * 0.2
+  for sq in squares_of(bb['Q']):
+    white_val += ((rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)) & ~occupancy[WHITE]).bit_count() * 0.2
 
+  for sq in squares_of(bb['n']):
+    black_val += (KNIGHT_ATTACKS[sq] & ~occupancy[BLACK]).bit_count() * 0.1
+  for sq in squares_of(bb['N']):
+    white_val += (KNIGHT_ATTACKS[sq] & ~occupancy[WHITE]).bit_count() * 0.1
 
+  for sq in squares_of(bb['b']):
+    black_val += (bishop_attacks(sq, occupied) & ~occupancy[BLACK]).bit_count() * 0.1
+  for sq in squares_of(bb['B']):
+    white_val += (bishop_attacks(sq, occupied) & ~occupancy[WHITE]).bit_count() * 0.1
 
+  black_val += black_pawn_rows * 0.3
+  white_val += white_pawn_rows * 0.3
+
+  for sq in squares_of(bb['k']):
+    moves = king_moves(board, BLACK, sq, occupied)
+    if black_piece_val >= 52 and moves == 0:
+      white_val += 5
+    elif black_piece_val <= 51:
+      white_val += int(4 * 1/max(moves, 1))
+  for sq in squares_of(bb['K']):
+    moves = king_moves(board, WHITE, sq, occupied)
+    if white_piece_val >= 52 and moves == 0:
+      black_val += 5
+    elif black_piece_val <= 51:
+      black_val += int(4 * 1/max(moves, 1))
 
   # Return a value favoring white if positive, and black if negative
   return white_val - black_val
+
+
+def king_moves(board: Board, color: int, sq: int, occupied: int) -> int:
+  """How many squares the king on sq can step to without landing on an attacked one.
+
+  The king is taken off the board first so it can't shelter behind itself.
+  """
+  attacked = attack_map(board, 1 - color, occupied & ~(1 << sq))
+  return (KING_ATTACKS[sq] & ~board.occupancy[color] & ~attacked).bit_count()
+
+
+# Evaluators by name, for settings that cross process boundaries or come from
+# the command line
+EVAL_FUNCS = {"basic_eval": basic_eval, "mobility_eval": mobility_eval}
@@ -3,15 +3,23 @@ from board import Board
 from piece import Piece, King, Knight, Pawn, Queen, Rook, Bishop
 from agent import *
 from evaluate import *
+from bitboard import insufficient_material
+from movecache import MoveCache
+from tables import square, POSITIONS
+from position import Position, parse_fen, pieces
 WHITE, BLACK = 0, 1
 ROW_SIZE = 5
 COL_SIZE = 4
 STARTING_FEN = "knbr/p3/4/3P/RBNK"
+# Positions a game remembers the legal moves of; a game only revisits a few
+GAME_MOVE_CACHE_SIZE = 64
 
 
 class Game:
   def __init__(self, agent1, agent2) -> None:
     self.board = Board(ROW_SIZE, COL_SIZE)
+    # Shared by the game-over check and the UI's per-piece moves
+    self.move_cache = MoveCache(GAME_MOVE_CACHE_SIZE)
     if agent1 is not None and agent2 is not None:
       player1 = (agent1(0, self.board, basic_eval)) if agent1 == MinimaxAgent else agent1(0, self.board)
       player2 = (agent2(1, self.board, basic_eval)) if agent2 == MinimaxAgent else agent1(1, self.board)
@@ -22,7 +30,6 @@ class Game:
   def _play(self) -> None:
     while True:
       for p in self.players:
-        p.my_king()[0].checks_and_pins()
         print(p.color)
         game_state = self.is_game_over(p.color)
         if game_state[0]:
@@ -42,7 +49,6 @@ class Game:
   def move(self, p: Agent) -> str | None:
     option, curr_pos, new_pos = p.get_move()
     curr_pos_piece = self.board.lookup(curr_pos)
-    new_pos_piece = self.board.lookup(new_pos)
 
     # Get all piece moves given piece coordinates
     if option == 0:
@@ -56,36 +62,12 @@ class Game:
         p.set_info("Invalid choice -- try again")
         return
 
-      self.board.remove(curr_pos)
-      self.board.forget_piece(curr_pos_piece)
-      curr_pos_piece.remove_pos()
-
-      if new_pos_piece is not None:
-        self.board.remove(new_pos)
-        self.board.forget_piece(new_pos_piece)
-        new_pos_piece.remove_pos()
-
-      self.board.place(new_pos, curr_pos_piece)
-      self.board.add_piece(curr_pos_piece)
-      curr_pos_piece.set_pos(new_pos)
+      self.board.push((square(curr_pos), square(new_pos)))
 
       return "DONE"
 
   def flask_move(self, curr_pos: tuple[int, int], new_pos: tuple[int, int]) -> None:
-    curr_pos_piece = self.board.lookup(curr_pos)
-    new_pos_piece = self.board.lookup(new_pos)
-    self.board.remove(curr_pos)
-    self.board.forget_piece(curr_pos_piece)
-    curr_pos_piece.remove_pos()
-
-    if new_pos_piece is not None:
-      self.board.remove(new_pos)
-      self.board.forget_piece(new_pos_piece)
-      new_pos_piece.remove_pos()
-
-    self.board.place(new_pos, curr_pos_piece)
-    self.board.add_piece(curr_pos_piece)
-    curr_pos_piece.set_pos(new_pos)
+    self.board.push((square(curr_pos), square(new_pos)))
 
   def make_piece(self, fen_char: str, pos: tuple[int, int]) -> Piece:
     mapping = {
@@ -108,50 +90,61 @@ class Game:
   def _starting_position(self):
     """Place starting position's chess pieces on board
     """
-    rows = STARTING_FEN.split("/")
-
-    for row_idx, row in enumerate(rows):
-      col_idx = 0
-      for c in row:
-        if c.isdigit():
-          col_idx += int(c)
-        else:
-          piece = self.make_piece(c, (row_idx, col_idx))
-          self.board.place((row_idx, col_idx), piece)
-          self.board.add_piece(piece)
-          piece.set_pos((row_idx, col_idx))
-          col_idx += 1
+    self.load_fen(STARTING_FEN)
+
+  def load_fen(self, fen: str) -> int:
+    """Replace the board's pieces with a FEN position and return the side to move.
+
+    The side to move is an optional "w" or "b" after the pieces and defaults to
+    white; see position.parse_fen for the full format.
+    """
+    return self.load_position(parse_fen(fen))
+
+  def load_position(self, position: Position) -> int:
+    """Replace the board's pieces with position's and return the side to move.
+    """
+    self.board.clear()
+    for sq, char in pieces(position):
+      pos = POSITIONS[sq]
+      piece = self.make_piece(char, pos)
+      self.board.place(pos, piece)
+      self.board.add_piece(piece)
+
+    return position.color
 
   def is_game_over(self, color, move_count: int) -> list:
     if move_count >= 50:
       return [True, 'Draw']
 
-    if len(self.board.pieces['R']) + len(self.board.pieces['r']) == 0:
-      if len(self.board.pieces['B']) + len(self.board.pieces['N']) == 1:
-        return [True, 'Draw']
-      elif len(self.board.pieces['b']) + len(self.board.pieces['n']) == 1:
-        return [True, 'Draw']
+    if insufficient_material(self.board):
+      return [True, 'Draw']
 
-    self.board.pieces["K"][0].checks_and_pins()
-    self.board.pieces["k"][0].checks_and_pins()
+    if len(self.legal_moves(color)) > 0:
+      return [False, 'Continue']
+    elif self.in_check(color):
+      return [True, 'Black Wins' if color == WHITE else 'White Wins']
+    else:
+      return [True, 'Draw']
 
+  def legal_moves(self, color: int) -> tuple[tuple[int, int], ...]:
+    """color's legal moves as (from_square, to_square) pairs, generated once per position.
+    """
+    return self.move_cache.legal_moves(self.board, color)
 
-    if color == WHITE:
-      all_moves = self.all_moves_by_color(WHITE)
-      if len(all_moves) == 0 and len(self.board.pieces["K"][0].get_checks()) >= 1:
-        return [True, 'Black Wins']
-      elif len(all_moves) == 0:
-        return [True, 'Draw']
-      else:
-        return [False, 'Continue']
-    else:
-      all_moves = self.all_moves_by_color(BLACK)
-      if len(all_moves) == 0 and len(self.board.pieces["k"][0].get_checks()) >= 1:
-        return [True, 'White Wins']
-      elif len(all_moves) == 0:
-        return [True, 'Draw']
-      else:
-        return [False, 'Continue']
+  def in_check(self, color: int) -> bool:
+    return self.board.in_check(color)
+
+  def moves_from(self, pos: tuple[int, int]) -> list[tuple[int, int]]:
+    """Where the piece on pos can legally move.
+
+    >>> Game(None, None).moves_from((4, 0))
+    [(1, 0), (2, 0), (3, 0)]
+    """
+    piece = self.board.lookup(pos)
+    if piece is None:
+      return []
+    sq = square(pos)
+    return [POSITIONS[to_sq] for from_sq, to_sq in self.legal_moves(piece.get_color()) if from_sq == sq]
 
   def all_moves_by_color(self, color: int) -> list[tuple[int, int]]:
     all_moves = []
@@ -0,0 +1,60 @@
+"""Legal move lists cached by position.
+
+The same position is asked for its moves many times: by the game-over check
+after a move, by every click in the UI, and by the search, which revisits most
+of the tree on each iteration of iterative deepening. MicroChess has no
+castling or en passant, so a position's legal moves depend only on its pieces
+and the side to move, and the Zobrist hash of both identifies it.
+"""
+from collections import OrderedDict
+from typing import *
+from bitboard import legal_moves
+from zobrist import side_key
+
+MOVE_CACHE_SIZE = 1 << 14
+
+
+class MoveCache:
+  """LRU map of position to its legal moves, holding at most size positions.
+
+  Move lists are returned as tuples, shared between callers.
+
+  >>> from game import Game
+  >>> from tables import WHITE, BLACK
+  >>> board = Game(None, None).board
+  >>> cache = MoveCache(size=2)
+  >>> len(cache.legal_moves(board, WHITE)), cache.misses
+  (11, 1)
+  >>> cache.legal_moves(board, WHITE) is cache.legal_moves(board, WHITE), cache.hits
+  (True, 2)
+  >>> _ = cache.legal_moves(board, BLACK)
+  >>> board.push((16, 4))
+  >>> len(cache.legal_moves(board, BLACK)), len(cache)
+  (1, 2)
+  """
+
+  def __init__(self, size: int = MOVE_CACHE_SIZE) -> None:
+    self.size = size
+    self.moves = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def __len__(self) -> int:
+    return len(self.moves)
+
+  def legal_moves(self, board, color: int) -> tuple[tuple[int, int], ...]:
+    key = side_key(board.hash, color)
+    moves = self.moves.get(key)
+    if moves is not None:
+      self.moves.move_to_end(key)
+      self.hits += 1
+      return moves
+
+    self.misses += 1
+    moves = self.moves[key] = tuple(legal_moves(board, color))
+    if len(self.moves) > self.size:
+      self.moves.popitem(last=False)
+    return moves
+
+  def clear(self) -> None:
+    self.moves.clear()
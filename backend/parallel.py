@@ -0,0 +1,198 @@
+"""Root-parallel search across processes.
+
+Each iteration searches the first root move in this process to get a bound,
+then hands every other root move to a worker, which only has to show whether
+the move beats that bound and re-searches it with a full window if it does.
+Workers start from the packed position after their move with a fresh
+transposition table and the agent's own evaluator and search settings, so a
+move's score depends only on the move, the depth and the bound. Merging in move
+order then makes the result the same however the work was scheduled::
+
+    python parallel.py --depth 7 --processes 4
+    python parallel.py --depth 6 --eval mobility_eval --quiescence-plies 0
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import *
+from game import Game
+from agent import MinimaxAgent, SearchTimeout, INFINITY, QUIESCENCE_PLIES
+from evaluate import EVAL_FUNCS
+from tablebase import Tablebase
+from zobrist import side_key
+from transposition import EXACT
+from position import Position, unpack
+
+# Set in each worker by _init_worker
+_tablebase = None
+
+
+def _init_worker() -> None:
+  global _tablebase
+  _tablebase = Tablebase()
+
+
+def search_subtree(packed: bytes, depth: int, alpha: float, deadline: Optional[float],
+                   settings: dict, use_tablebase: bool) -> tuple[Optional[float], int, int]:
+  """Score the root move that led to the packed position, from the root side's point of view.
+
+  settings are the searching agent's: its evaluator's name in EVAL_FUNCS under
+  "eval", and its tt_size, quiescence_plies and node_limit, the nodes this
+  subtree may use.
+
+  Returns (score, nodes, worker pid). A score at or below alpha is only an
+  upper bound, which is all the merge needs; the score is None if the search
+  ran past deadline (a time.time() value) or its node limit.
+  """
+  game = Game(None, None)
+  color = game.load_position(unpack(packed))
+  settings = dict(settings)
+  eval_func = EVAL_FUNCS[settings.pop("eval")]
+  agent = MinimaxAgent(color, game.board, eval_func, tablebase=_tablebase if use_tablebase else None,
+                       **settings)
+  if deadline is not None:
+    agent.deadline = time.perf_counter() + deadline - time.time()
+  if deadline is not None or agent.node_limit is not None:
+    # negamax only checks the budget once a depth has completed
+    agent.completed_depth = 1
+
+  try:
+    # Shallow passes fill the table with hash moves for the deepest one
+    for d in range(1, depth + 1):
+      score = -agent.negamax(d, -alpha - 1, -alpha, color, 1)
+    if score > alpha:
+      score = -agent.negamax(depth, -INFINITY, -alpha, color, 1)
+  except SearchTimeout:
+    score = None
+  return score, agent.nodes, os.getpid()
+
+
+class ParallelAgent(MinimaxAgent):
+  """MinimaxAgent whose root moves are searched by a pool of processes.
+
+  worker_nodes maps each worker's pid to the nodes it searched during the last
+  get_move, with this process under "main".
+
+  Workers rebuild the evaluator by name, so eval_func has to be one of
+  EVAL_FUNCS.
+  """
+
+  def __init__(self, color: int, board, eval_func, processes: Optional[int] = None, **kwargs) -> None:
+    super().__init__(color, board, eval_func, **kwargs)
+    name = getattr(eval_func, "__name__", None)
+    if EVAL_FUNCS.get(name) is not eval_func:
+      raise ValueError(f"ParallelAgent workers only know the evaluators in EVAL_FUNCS: {', '.join(EVAL_FUNCS)}")
+    self.processes = processes or os.cpu_count() or 1
+    self.worker_settings = {"eval": name, "tt_size": kwargs.get("tt_size", 1 << 16),
+                            "quiescence_plies": self.quiescence_plies}
+    self.executor = None
+    self.worker_nodes = {}
+
+  def close(self) -> None:
+    if self.executor is not None:
+      self.executor.shutdown(cancel_futures=True)
+      self.executor = None
+
+  def get_move(self):
+    self.worker_nodes = {}
+    move = super().get_move()
+    self.worker_nodes["main"] = self.nodes - sum(self.worker_nodes.values())
+    return move
+
+  def search(self, depth: int) -> tuple:
+    board = self.board
+    color = self.color
+    moves = self.legal_moves(board, color)
+    if depth <= 1 or len(moves) == 1 or self.processes <= 1:
+      return super().search(depth)
+    if self.executor is None:
+      self.executor = ProcessPoolExecutor(max_workers=self.processes, initializer=_init_worker)
+
+    key = side_key(board.hash, color)
+    entry = self.tt.probe(key)
+    moves = self.order_moves(moves, entry[4] if entry is not None else None, 0)
+
+    board.push(moves[0])
+    best_score = -self.negamax(depth - 1, -INFINITY, INFINITY, 1 - color, 1)
+    board.pop()
+    best_move = moves[0]
+
+    deadline = None
+    if self.deadline is not None:
+      deadline = time.time() + self.deadline - time.perf_counter()
+    settings = self.worker_settings
+    if self.node_limit is not None:
+      # Each subtree may use what is left; check_budget below enforces the total
+      settings = {**settings, "node_limit": max(self.node_limit - self.nodes, 1)}
+    root = Position.from_board(board, color)
+    futures = []
+    for move in moves[1:]:
+      futures.append(self.executor.submit(search_subtree, root.push(move).pack(),
+                                          depth - 1, best_score, deadline, settings,
+                                          self.tablebase is not None))
+
+    timed_out = False
+    for move, future in zip(moves[1:], futures):
+      score, nodes, pid = future.result()
+      self.nodes += nodes
+      self.worker_nodes[pid] = self.worker_nodes.get(pid, 0) + nodes
+      if score is None:
+        timed_out = True
+      # Strictly greater, so ties go to the earlier move in search order
+      elif score > best_score:
+        best_score, best_move = score, move
+    if timed_out:
+      raise SearchTimeout
+    self.check_budget()
+
+    self.tt.store(key, depth, EXACT, best_score, best_move)
+    return (best_score, best_move)
+
+
+def compare(fen: str, depth: int, processes: int, eval_name: str = "basic_eval",
+            quiescence_plies: int = QUIESCENCE_PLIES) -> dict:
+  """Search fen to depth serially and in parallel and report both.
+
+  >>> report = compare("knbr/p3/4/1R1P/1BNK w", 4, 2, "mobility_eval", quiescence_plies=0)
+  >>> report["serial"]["move"] == report["parallel"]["move"]
+  True
+  """
+  report = {}
+  for name, agent_class, kwargs in (("serial", MinimaxAgent, {}),
+                                    ("parallel", ParallelAgent, {"processes": processes})):
+    game = Game(None, None)
+    color = game.load_fen(fen)
+    agent = agent_class(color, game.board, EVAL_FUNCS[eval_name], depth=depth,
+                        quiescence_plies=quiescence_plies, **kwargs)
+    start = time.perf_counter()
+    _, curr_pos, new_pos = agent.get_move()
+    seconds = time.perf_counter() - start
+    report[name] = {"move": (curr_pos, new_pos), "nodes": agent.nodes, "seconds": seconds,
+                    "worker_nodes": getattr(agent, "worker_nodes", {})}
+    if isinstance(agent, ParallelAgent):
+      agent.close()
+  report["speedup"] = report["serial"]["seconds"] / max(report["parallel"]["seconds"], 1e-9)
+  return report
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description="Compare serial and root-parallel MicroChess search")
+  parser.add_argument("--fen", default="knbr/p3/4/3P/RBNK w", help="position to search, with optional side to move")
+  parser.add_argument("--depth", type=int, default=7)
+  parser.add_argument("--processes", type=int, default=os.cpu_count())
+  parser.add_argument("--eval", choices=EVAL_FUNCS, default="basic_eval")
+  parser.add_argument("--quiescence-plies", type=int, default=QUIESCENCE_PLIES)
+  args = parser.parse_args()
+
+  report = compare(args.fen, args.depth, args.processes, args.eval, args.quiescence_plies)
+  for name in ("serial", "parallel"):
+    result = report[name]
+    print(f"{name}: {result['move'][0]} -> {result['move'][1]}, {result['nodes']} nodes in {result['seconds']:.2f}s")
+  for worker, nodes in sorted(report["parallel"]["worker_nodes"].items(), key=str):
+    print(f"  {worker}: {nodes} nodes")
+  print(f"speedup: {report['speedup']:.2f}x on {args.processes} processes")
+
+
+if __name__ == "__main__":
+  main()
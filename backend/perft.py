@@ -0,0 +1,136 @@
+"""Perft: count the leaf nodes of the legal move tree to a fixed depth.
+
+Perft counts only depend on the rules, so they pin down move generation
+exactly: any change to the generators must keep REFERENCE_POSITIONS passing,
+and the nodes/sec figure shows whether it made generation faster. Both the
+bitboard generator used by the search and the Piece.moves() generator used by
+the UI can be checked::
+
+    python perft.py --depth 5 --divide
+    python perft.py --fen "2k1/r3/R3/4/K3 w" --depth 4 --generator pieces
+    python perft.py --suite
+"""
+import argparse
+import time
+from typing import *
+from board import Board
+from game import Game
+from agent import all_moves_by_color_dict
+from bitboard import legal_moves
+from tables import square, position, WHITE, BLACK
+
+# (FEN with side to move, leaf counts for depth 1, 2, ...)
+REFERENCE_POSITIONS = [
+    ("knbr/p3/4/3P/RBNK w", [11, 95, 805, 6877, 61243]),
+    ("1kbr/3R/p1P1/4/2NK w", [9, 47, 413, 2644, 23333]),
+    ("1k2/2r1/pBRP/4/2K1 w", [13, 95, 1069, 6387, 68786]),
+    ("2rP/2R1/k3/p3/2K1 w", [6, 36, 254, 1772, 12641]),
+    ("2k1/r3/R3/4/K3 w", [5, 43, 332, 2501, 19990]),
+    ("1kbr/p3/2PR/4/2NK w", [8, 53, 449, 3100, 27391]),
+    ("k3/2R1/1K2/4/4 b", [1, 12, 18, 177, 355]),
+    ("kn2/pr2/4/2P1/RBNK b", [9, 61, 492, 3851, 31403]),
+]
+
+
+def bitboard_moves(board: Board, color: int) -> list[tuple[int, int]]:
+  return legal_moves(board, color)
+
+
+def piece_moves(board: Board, color: int) -> list[tuple[int, int]]:
+  """Legal moves from the Piece classes, as (from_square, to_square) pairs.
+  """
+  return [(square(piece.get_pos()), square(move))
+          for piece, moves in all_moves_by_color_dict(board, color).items() for move in moves]
+
+
+GENERATORS = {"bitboard": bitboard_moves, "pieces": piece_moves}
+
+
+def perft(board: Board, color: int, depth: int, move_func=bitboard_moves) -> int:
+  """
+  >>> game = Game(None, None)
+  >>> perft(game.board, WHITE, 3)
+  805
+  >>> perft(game.board, WHITE, 3, piece_moves)
+  805
+  """
+  moves = move_func(board, color)
+  if depth <= 1:
+    return len(moves) if depth == 1 else 1
+
+  nodes = 0
+  for move in moves:
+    board.push(move)
+    nodes += perft(board, 1 - color, depth - 1, move_func)
+    board.pop()
+  return nodes
+
+
+def divide(board: Board, color: int, depth: int, move_func=bitboard_moves) -> dict[tuple[int, int], int]:
+  """Perft split by root move, for narrowing down where two generators disagree.
+  """
+  counts = {}
+  for move in move_func(board, color):
+    board.push(move)
+    counts[move] = perft(board, 1 - color, depth - 1, move_func)
+    board.pop()
+  return counts
+
+
+def timed_perft(fen: str, depth: int, move_func=bitboard_moves) -> tuple[int, float]:
+  """Run perft from a FEN and return (nodes, seconds).
+  """
+  game = Game(None, None)
+  color = game.load_fen(fen)
+  start = time.perf_counter()
+  nodes = perft(game.board, color, depth, move_func)
+  return nodes, time.perf_counter() - start
+
+
+def run_suite(max_depth: int, move_func=bitboard_moves) -> bool:
+  """Check every reference position up to max_depth, printing nodes/sec.
+  """
+  passed = True
+  total_nodes, total_time = 0, 0.0
+  for fen, counts in REFERENCE_POSITIONS:
+    for depth, expected in enumerate(counts[:max_depth], start=1):
+      nodes, seconds = timed_perft(fen, depth, move_func)
+      total_nodes += nodes
+      total_time += seconds
+      if nodes != expected:
+        passed = False
+        print(f"FAIL {fen} depth {depth}: {nodes} nodes, expected {expected}")
+  print(f"{'passed' if passed else 'FAILED'}: {total_nodes} nodes in {total_time:.2f}s "
+        f"({total_nodes / max(total_time, 1e-9):.0f} nodes/sec)")
+  return passed
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description="Count MicroChess move-generation leaf nodes")
+  parser.add_argument("--fen", default="knbr/p3/4/3P/RBNK w", help="position to search, with optional side to move")
+  parser.add_argument("--depth", type=int, default=4)
+  parser.add_argument("--divide", action="store_true", help="print the count under each root move")
+  parser.add_argument("--suite", action="store_true", help="check the reference positions up to --depth")
+  parser.add_argument("--generator", choices=sorted(GENERATORS), default="bitboard")
+  args = parser.parse_args()
+  move_func = GENERATORS[args.generator]
+
+  if args.suite:
+    raise SystemExit(0 if run_suite(args.depth, move_func) else 1)
+
+  game = Game(None, None)
+  color = game.load_fen(args.fen)
+  start = time.perf_counter()
+  if args.divide:
+    counts = divide(game.board, color, args.depth, move_func)
+    for move, count in counts.items():
+      print(f"{position(move[0])} -> {position(move[1])}: {count}")
+    nodes = sum(counts.values())
+  else:
+    nodes = perft(game.board, color, args.depth, move_func)
+  seconds = time.perf_counter() - start
+  print(f"depth {args.depth}: {nodes} nodes in {seconds:.3f}s ({nodes / max(seconds, 1e-9):.0f} nodes/sec)")
+
+
+if __name__ == "__main__":
+  main()
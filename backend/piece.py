@@ -1,14 +1,18 @@
 from typing import *
 from board import Board
-WHITE, BLACK = 0, 1
+from tables import *
 
 
 class Piece:
+  # Pieces are created for every game, so they carry no __dict__; move
+  # offsets and target tables are shared by each class
+  __slots__ = ("color", "pos", "board")
+  offsets = ()
+
   def __init__(self, color: int, pos: tuple[int, int], board: Board) -> None:
     self.color = color
     self.pos = tuple(pos)
     self.board = board
-    self.offsets = None
 
   def __str__(self) -> str:
     raise NotImplementedError(
@@ -28,25 +32,24 @@ class Piece:
 
   def possible_moves(self, sliding=False):
     moves = []
-    curr_pos = self.get_pos()
     board = self.board
+    sq = square(self.get_pos())
 
-    for offset in self.offsets:
-      new_pos = (curr_pos[0] + offset[0], curr_pos[1] + offset[1])
-
-      if sliding:
-        while board.is_valid_pos(new_pos):
-          if board.is_empty_pos(new_pos) or board.lookup(new_pos).get_color() != self.get_color():
+    if sliding:
+      for ray in self.rays[sq]:
+        for new_pos in ray:
+          piece = board.lookup(new_pos)
+          if piece is None:
             moves.append(new_pos)
+            continue
+          if piece.get_color() != self.get_color():
+            moves.append(new_pos)
+          break
 
-          if not board.is_empty_pos(new_pos):
-            break
-
-          new_pos = (new_pos[0] + offset[0], new_pos[1] + offset[1])
-
-      else:
-        if board.is_valid_pos(new_pos) and \
-                (board.is_empty_pos(new_pos) or board.lookup(new_pos).get_color() != self.get_color()):
+    else:
+      for new_pos in self.targets[sq]:
+        piece = board.lookup(new_pos)
+        if piece is None or piece.get_color() != self.get_color():
           moves.append(new_pos)
     return moves
 
@@ -61,112 +64,38 @@ class Piece:
 
 
 class King(Piece):
-  def __init__(self, color: int, pos: tuple[int, int], board: Board) -> None:
-    super().__init__(color, pos, board)
-    self.offsets = [(1, 0), (0, 1), (-1, 0), (0, -1),
-                    (1, 1), (1, -1), (-1, 1), (-1, -1)]
-    self.checks = []
-    self.pins = {}
+  __slots__ = ()
+  offsets = KING_OFFSETS
+  targets = KING_TARGETS
 
   def __str__(self) -> str:
     return "K" if self.get_color() == WHITE else "k"
 
-  def get_checks(self) -> list[tuple[int, int]]:
-    return self.checks
+  def get_checks(self) -> list[Piece]:
+    return self.board.checks_and_pins(self.color)[0]
 
   def get_pins(self) -> dict:
-    return self.pins
+    return self.board.checks_and_pins(self.color)[1]
 
   def checks_and_pins(self) -> None:
-    """
+    """Find the pieces checking this king and the pieces pinned to it.
+
+    The result is kept by the board until the next move, see
+    Board.checks_and_pins, and read through get_checks and get_pins, so
+    calling this is only needed to find them ahead of time.
+
     >>> board = Board(5, 4)
     >>> R = Rook(WHITE, (0, 0), board)
     >>> k = King(BLACK, (4, 0), board)
-    >>> n = Knight(BLACK, (3, 2), board)
+    >>> N = Knight(WHITE, (3, 2), board)
     >>> board.add_piece_place_piece((0, 0), R)
     >>> board.add_piece_place_piece((4, 0), k)
-    >>> board.add_piece_place_piece((3, 2), n)
+    >>> board.add_piece_place_piece((3, 2), N)
     >>> k.checks_and_pins()
-    >>> len(k.checks) == 2
+    >>> len(k.get_checks()) == 2
     True
     """
-    curr_pos = self.get_pos()
-    checks = []
-    pins = {}
-
-    # Checking for checks and pins by sliding pieces
-    for offset in self.offsets:
-      possible_pos = (curr_pos[0] + offset[0], curr_pos[1] + offset[1])
-      shields = []
-      while self.board.is_valid_pos(possible_pos):
-        piece_at_cell = self.board.lookup(possible_pos)
-
-        if piece_at_cell is None:
-          possible_pos = (possible_pos[0] + offset[0], possible_pos[1] + offset[1])
-
-        # If king's teammate is blocking him
-        elif piece_at_cell.get_color() == self.get_color():
-
-          if offset[1] == 0:
-            shields.append((piece_at_cell, "v"))
-          elif offset[0] == 0:
-            shields.append((piece_at_cell, "h"))
-          else:
-            shields.append((piece_at_cell, "d"))
-
-          if len(shields) > 1:
-            break
-          else:
-            possible_pos = (possible_pos[0] + offset[0], possible_pos[1] + offset[1])
-
-        # Checking for horizontal/vertical (ex. (1 * 0) => 0)) and not same color
-        elif (offset[0] * offset[1] == 0) and (isinstance(piece_at_cell, Rook) or isinstance(piece_at_cell, Queen)):
-          if len(shields) == 1:
-            pins[shields[0][0]] = (shields[0][1], piece_at_cell.get_pos())
-          else:
-            checks.append(piece_at_cell)
-          break
-
-        # Checking for diagonal (ex. (1 * 1) => 1)) and not same color
-        elif (offset[0] * offset[1] != 0) and (isinstance(piece_at_cell, Bishop) or isinstance(piece_at_cell, Queen)):
-          if len(shields) == 1:
-            pins[shields[0][0]] = (shields[0][1], piece_at_cell.get_pos())
-          else:
-            checks.append(piece_at_cell)
-
-          break
-
-        # When enemy bishop is on horizontal/vertical line or rook on diagonal
-        else:
-          break
-
-    # Checking for check by knight
-    for offset in Knight.MOVE_OFFSETS:
-      possible_pos = (curr_pos[0] + offset[0], curr_pos[1] + offset[1])
-
-      if self.board.is_valid_pos(possible_pos) and isinstance(self.board.lookup(possible_pos), Knight) and self.board.lookup(possible_pos).color != self.color:
-        checks.append(self.board.lookup(possible_pos))
-
-    # Checking for check by pawn
-    vertical_direction = -1 if self.get_color() == WHITE else 1
-    # Capture moves (diagonal)
-    diagonal_moves = [
-        (curr_pos[0] + vertical_direction, curr_pos[1] - 1),
-        (curr_pos[0] + vertical_direction, curr_pos[1] + 1)
-    ]
-
-    for move in diagonal_moves:
-      if self.board.is_valid_pos(move):
-        piece_at_cell = self.board.lookup(move)
-        if piece_at_cell is not None:
-          if piece_at_cell.get_color() != self.get_color() and isinstance(piece_at_cell, Pawn):
-            checks.append(piece_at_cell)
-
-    if len(checks) > 2:
-      raise ValueError("More than 2 pieces can not check at once")
-    else:
-      self.checks = checks
-      self.pins = pins
+    self.board.checks_and_pins(self.color)
 
   def is_pos_attacked(self, pos: tuple[int, int]) -> bool:
     """
@@ -183,52 +112,10 @@ class King(Piece):
     >>> P = Pawn(WHITE, (3, 1), board)
     >>> board.place((4, 1), k)
     >>> board.place((3, 1), P)
-    >>> k.is_pos_attacked((4, 0))
-    True
+    >>> k.is_pos_attacked((4, 0)), k.is_pos_attacked((2, 0))
+    (False, True)
     """
-    for offset in self.offsets:
-      next_pos = (pos[0] + offset[0], pos[1] + offset[1])
-      while self.board.is_valid_pos(next_pos):
-        piece = self.board.lookup(next_pos)
-        if piece is None: next_pos = (next_pos[0] + offset[0], next_pos[1] + offset[1])
-        elif piece.get_color() == self.get_color(): break
-        else:
-          if offset[0] * offset[1] == 0 and (isinstance(piece, Rook) or isinstance(piece, Queen) or isinstance(piece, King)):
-            return True
-          elif abs(offset[0] * offset[1]) == 1 and (isinstance(piece, Bishop) or isinstance(piece, Queen)) or isinstance(piece, King):
-            return True
-          elif offset[0] * offset[1] == 1 and isinstance(piece, Bishop) or isinstance(piece, Queen):
-            return True
-          elif abs(offset[0] * offset[1] == 1) and (next_pos[0] - offset[0], next_pos[1] - offset[0]) == pos:
-            return True
-          else:
-            break
-
-    for offset in Knight.MOVE_OFFSETS:
-      next_pos = (pos[0] + offset[0], pos[1] + offset[1])
-      if self.board.is_valid_pos(next_pos):
-        piece = self.board.lookup(next_pos)
-      else:
-        continue
-      if piece is not None and isinstance(piece, Knight):
-        return True
-
-    return False
-
-  def _opponent_pieces(self) -> list[Piece]:
-    opps = []
-    if self.color == WHITE:
-      for p in self.board.pieces:
-        if p.islower():
-          for piece in self.board.pieces[p]:
-            opps.append(piece)
-    else:
-      for p in self.board.pieces:
-        if p.isupper():
-          for piece in self.board.pieces[p]:
-            opps.append(piece)
-
-    return opps
+    return self.board.attacks(1 - self.color) >> square(pos) & 1 == 1
 
   def moves(self) -> list[tuple[int, int]]:
     """
@@ -242,34 +129,24 @@ class King(Piece):
     True
 
     """
-    curr_pos = self.get_pos()
+    danger = self.board.attacks(1 - self.color)
     moves = []
-    opponent_color = BLACK if self.get_color() == WHITE else WHITE
-    for offset in self.offsets:
-      possible_pos = (curr_pos[0] + offset[0], curr_pos[1] + offset[1])
-      if not self.board.is_valid_pos(possible_pos):
+    for possible_pos in KING_TARGETS[square(self.get_pos())]:
+      if danger >> square(possible_pos) & 1:
         continue
-      elif self.board.lookup(possible_pos) is None or self.board.lookup(possible_pos).get_color() == opponent_color:
-        if all(possible_pos not in piece.attacking_squares() for piece in self._opponent_pieces()):
-          moves.append(possible_pos)
+      piece = self.board.lookup(possible_pos)
+      if piece is None or piece.get_color() != self.color:
+        moves.append(possible_pos)
     return moves
 
   def attacking_squares(self) -> set:
-    squares = set()
-    for offset in self.offsets:
-      pos = (self.get_pos()[0] + offset[0], self.get_pos()[1] + offset[1])
-      if self.board.is_valid_pos(pos):
-        squares.add(pos)
-    return squares
+    return set(self.targets[square(self.get_pos())])
 
 
 class Knight(Piece):
-  MOVE_OFFSETS = [(1, 2), (1, -2), (-1, 2), (-1, -2),
-                  (2, 1), (2, -1), (-2, 1), (-2, -1)]
-
-  def __init__(self, color: int, pos: tuple[int, int], board: Board) -> None:
-    super().__init__(color, pos, board)
-    self.offsets = Knight.MOVE_OFFSETS
+  __slots__ = ()
+  offsets = KNIGHT_OFFSETS
+  targets = KNIGHT_TARGETS
 
   def __str__(self) -> str:
     return "N" if self.get_color() == WHITE else "n"
@@ -327,34 +204,27 @@ class Knight(Piece):
       return self.possible_moves()
 
   def attacking_squares(self) -> set:
-    squares = set()
-    for offset in self.offsets:
-      pos = (self.get_pos()[0] + offset[0], self.get_pos()[1] + offset[1])
-      if self.board.is_valid_pos(pos):
-        squares.add(pos)
-    return squares
+    return set(self.targets[square(self.get_pos())])
 
 class Pawn(Piece):
-  def __init__(self, color: int, pos: tuple[int, int], board: Board) -> None:
-    super().__init__(color, pos, board)
+  __slots__ = ()
 
   def __str__(self) -> str:
     return "P" if self.get_color() == WHITE else "p"
 
   def possible_moves(self):
     moves = []
-    curr_pos = self.get_pos()
-    forward_d = -1 if self.get_color() == WHITE else 1
+    sq = square(self.get_pos())
 
     # Forward
-    new_pos = (curr_pos[0] + forward_d, curr_pos[1])
-    if self.board.is_valid_pos(new_pos) and self.board.is_empty_pos(new_pos):
+    new_pos = PAWN_PUSH[self.get_color()][sq]
+    if new_pos is not None and self.board.is_empty_pos(new_pos):
       moves.append(new_pos)
 
     # Capture
-    for horizontal_d in [1, -1]:
-      new_pos = (curr_pos[0] + forward_d, curr_pos[1] + horizontal_d)
-      if self.board.is_valid_pos(new_pos) and not self.board.is_empty_pos(new_pos) and self.board.lookup(new_pos).get_color() != self.get_color():
+    for new_pos in PAWN_CAPTURES[self.get_color()][sq]:
+      piece = self.board.lookup(new_pos)
+      if piece is not None and piece.get_color() != self.get_color():
         moves.append(new_pos)
 
     return moves
@@ -414,12 +284,9 @@ class Pawn(Piece):
 
       elif pins[self][0] == "v":
 
-        curr_pos = self.get_pos()
-        forward_d = -1 if self.get_color() == WHITE else 1
-
         # Forward
-        new_pos = (curr_pos[0] + forward_d, curr_pos[1])
-        if self.board.is_valid_pos(new_pos) and self.board.is_empty_pos(new_pos):
+        new_pos = PAWN_PUSH[self.get_color()][square(self.get_pos())]
+        if new_pos is not None and self.board.is_empty_pos(new_pos):
           return [new_pos]
         else:
           return []
@@ -434,22 +301,13 @@ class Pawn(Piece):
       return self.possible_moves()
 
   def attacking_squares(self) -> set:
-
-    forward_d = -1 if self.get_color() == WHITE else 1
-    squares = set()
-    for horizontal_d in [1, -1]:
-      pos = (self.get_pos()[0] + forward_d, self.get_pos()[1] + horizontal_d)
-      if self.board.is_valid_pos(pos):
-        squares.add(pos)
-
-    return squares
+    return set(PAWN_CAPTURES[self.get_color()][square(self.get_pos())])
 
 
 
 
 class SlidingPiece(Piece):
-  def __init__(self, color: int, pos: tuple[int, int], board: Board):
-    super().__init__(color, pos, board)
+  __slots__ = ()
 
   def possible_moves(self, sliding=True):
     return super().possible_moves(sliding)
@@ -503,9 +361,11 @@ class SlidingPiece(Piece):
     elif self in pins:
       curr_pos = self.get_pos()
       pinner_pos = pins[self][1]
+      # A pinned slider may travel anywhere between its king and the pinner
+      pin_moves = [move for move in check_line(my_king.get_pos(), pinner_pos) if move != curr_pos]
 
       if len(self.offsets) == 8:
-        return pin_line(curr_pos, pinner_pos)
+        return pin_moves
 
       else:
         piece_type = "vh" if self.offsets[0][0] * \
@@ -514,7 +374,7 @@ class SlidingPiece(Piece):
 
         if ((pin_type == "v" or pin_type == "h") and piece_type == "vh") or \
                 (pin_type == "d" and piece_type == "d"):
-          return pin_line(curr_pos, pinner_pos)
+          return pin_moves
         else:
           return []
 
@@ -523,91 +383,47 @@ class SlidingPiece(Piece):
 
   def attacking_squares(self) -> set:
     squares = set()
-    for offset in self.offsets:
-      pos = (self.get_pos()[0] + offset[0], self.get_pos()[1] + offset[1])
-      while self.board.is_valid_pos(pos):
-        if self.board.lookup(pos) is not None:
-          squares.add(pos)
-          if isinstance(self.board.lookup(pos), King) and self.board.lookup(pos).color != self.get_color():
-            pos = (pos[0] + offset[0], pos[1] + offset[1])
-          else:
-            break
-        else:
-          squares.add(pos)
-          pos = (pos[0] + offset[0], pos[1] + offset[1])
+    for ray in self.rays[square(self.get_pos())]:
+      for pos in ray:
+        squares.add(pos)
+        piece = self.board.lookup(pos)
+        # Attacks x-ray through the enemy king so it cannot step back along the line
+        if piece is not None and not (isinstance(piece, King) and piece.color != self.get_color()):
+          break
 
     return squares
 
 
 class Queen(SlidingPiece):
-
-  def __init__(self, color: int, pos: tuple[int, int], board: Board):
-    super().__init__(color, pos, board)
-    self.offsets = [(1, 0), (0, 1), (-1, 0), (0, -1),
-                    (1, 1), (1, -1), (-1, 1), (-1, -1)]
+  __slots__ = ()
+  offsets = DIRECTIONS
+  rays = RAYS
 
   def __str__(self) -> str:
     return "Q" if self.get_color() == WHITE else "q"
 
 
 class Rook(SlidingPiece):
-  MOVE_OFFSETS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
-
-  def __init__(self, color: int, pos: tuple[int, int], board: Board) -> None:
-    super().__init__(color, pos, board)
-    self.offsets = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+  __slots__ = ()
+  offsets = tuple(DIRECTIONS[direction] for direction in ORTHOGONAL)
+  rays = ORTHOGONAL_RAYS
 
   def __str__(self) -> str:
     return "R" if self.get_color() == WHITE else "r"
 
 
 class Bishop(SlidingPiece):
-  MOVE_OFFSETS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-
-  def __init__(self, color: int, pos: tuple[int, int], board: Board) -> None:
-    super().__init__(color, pos, board)
-    self.offsets = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+  __slots__ = ()
+  offsets = tuple(DIRECTIONS[direction] for direction in DIAGONAL)
+  rays = DIAGONAL_RAYS
 
   def __str__(self) -> str:
     return "B" if self.get_color() == WHITE else "b"
 
 
-def check_line(king_pos: tuple[int, int], checker_pos: tuple[int, int]) -> list[tuple[int, int]]:
-  vector = (checker_pos[0] - king_pos[0], checker_pos[1] - king_pos[1])
-  if vector[0] != 0:
-    vector = (vector[0] // abs(vector[0]), vector[1])
-  if vector[1] != 0:
-    vector = (vector[0], vector[1] // abs(vector[1]))
-
-  checker_pos = tuple(checker_pos)
-  pin_line = []
-
-  curr_pos = king_pos
-
-  while curr_pos != checker_pos:
-    curr_pos = ((curr_pos[0] + vector[0]), (curr_pos[1] + vector[1]))
-    pin_line.append(curr_pos)
-
-  return pin_line
-
-
-def pin_line(pin_pos: tuple[int, int], pinner_pos: tuple[int, int]) -> list[tuple[int, int]]:
-  vector = (pinner_pos[0] - pin_pos[0], pinner_pos[1] - pin_pos[1])
-
-  if vector[0] != 0:
-    vector = (vector[0] / abs(vector[0]), vector[1])
-  if vector[1] != 0:
-    vector = (vector[0], vector[1] / abs(vector[1]))
-
-  pin_line = []
-  pinner_pos = tuple(pinner_pos)
-  curr_pos = pin_pos
-
-  while curr_pos != pinner_pos:
-    curr_pos = (int(curr_pos[0] + vector[0]), int(curr_pos[1] + vector[1]))
-    pin_line.append(curr_pos)
-
-  return pin_line
-
+def check_line(king_pos: tuple[int, int], checker_pos: tuple[int, int]) -> tuple[tuple[int, int], ...]:
+  return LINES[square(king_pos)][square(checker_pos)]
 
 
+def pin_line(pin_pos: tuple[int, int], pinner_pos: tuple[int, int]) -> tuple[tuple[int, int], ...]:
+  return LINES[square(pin_pos)][square(pinner_pos)]
@@ -0,0 +1,185 @@
+"""Immutable MicroChess positions and their FEN and packed binary forms.
+
+A Position is the pieces, the side to move and the halfmove count, with the
+pieces held as bitboard.encode's 20 signed bytes. Positions are hashable, so
+they can key caches directly, and they convert to and from:
+
+* FEN, "knbr/p3/4/3P/RBNK w 0": the pieces as Board prints them, then "w" or
+  "b" for the side to move and the halfmove count. The last two fields are
+  optional when parsing and default to white and 0.
+* A packed 11 byte string: the 20 squares at 4 bits each, low nibble first,
+  then one byte holding the side to move in the top bit and the halfmove count
+  in the other seven. This is what gets stored and sent to worker processes.
+
+A Position has no Piece objects and no references back to a Board, so copying
+one is free and push makes a new position rather than changing it. Its view()
+has the bitboards and occupancy masks the bitboard module reads, built in one
+pass, so analysis code can generate moves and fork positions without building a
+Board at all.
+"""
+from typing import *
+from bitboard import encode, PIECE_CODES
+from tables import WHITE, BLACK, ROW_SIZE, COL_SIZE, NUM_SQUARES
+
+PACKED_SIZE = NUM_SQUARES // 2 + 1
+MAX_HALFMOVES = 127
+
+# Signed square codes (as unsigned bytes) to FEN characters and 4 bit codes:
+# 0 is empty, 1 to 6 white pieces and 7 to 12 black ones
+_CHARS = {code & 0xFF: char for char, code in PIECE_CODES.items()}
+_CODES = {char: code & 0xFF for char, code in PIECE_CODES.items()}
+_TO_NIBBLE = bytes(code if code <= 6 else 6 - (code - 256) if code in _CHARS else 0 for code in range(256))
+_FROM_NIBBLE = {nibble: code for code, nibble in enumerate(_TO_NIBBLE) if nibble or not code}
+# Every packed square byte to the two square codes it holds
+_UNPACKED = tuple(bytes((_FROM_NIBBLE.get(byte & 0xF, 0), _FROM_NIBBLE.get(byte >> 4, 0))) for byte in range(256))
+
+
+class Position(NamedTuple):
+  squares: bytes
+  color: int = WHITE
+  halfmoves: int = 0
+
+  @classmethod
+  def from_board(cls, board, color: int = WHITE, halfmoves: int = 0) -> "Position":
+    """The position on board with color to move.
+
+    >>> from game import Game
+    >>> Position.from_board(Game(None, None).board, BLACK, 1).fen()
+    'knbr/p3/4/3P/RBNK b 1'
+    """
+    return cls(encode(board), color, halfmoves)
+
+  def view(self) -> "PositionView":
+    """The position's bitboards, for the functions in bitboard.
+
+    Build it once per position and pass it to every call, rather than a view
+    per call.
+
+    >>> from bitboard import legal_moves, in_check
+    >>> start = parse_fen("knbr/p3/4/3P/RBNK w")
+    >>> view = start.view()
+    >>> len(legal_moves(view, start.color)), in_check(view, start.color)
+    (11, False)
+    """
+    return PositionView(self.squares)
+
+  def push(self, move: tuple[int, int]) -> "Position":
+    """The position after move, a (from_square, to_square) pair, with the other side to move.
+
+    >>> start = parse_fen("knbr/p3/4/3P/RBNK w")
+    >>> start.push((16, 4)).fen()
+    'knbr/R3/4/3P/1BNK b 1'
+    """
+    from_sq, to_sq = move
+    squares = bytearray(self.squares)
+    squares[to_sq] = squares[from_sq]
+    squares[from_sq] = 0
+    return Position(bytes(squares), 1 - self.color, self.halfmoves + 1)
+
+  def fen(self) -> str:
+    rows = []
+    for start in range(0, NUM_SQUARES, COL_SIZE):
+      row = ""
+      empty = 0
+      for code in self.squares[start:start + COL_SIZE]:
+        if code == 0:
+          empty += 1
+          continue
+        if empty:
+          row += str(empty)
+          empty = 0
+        row += _CHARS[code]
+      rows.append(row + str(empty) if empty else row)
+    return f"{'/'.join(rows)} {'w' if self.color == WHITE else 'b'} {self.halfmoves}"
+
+  def pack(self) -> bytes:
+    """The position in PACKED_SIZE bytes, see unpack.
+
+    >>> position = parse_fen("knbr/p3/4/3P/RBNK b 12")
+    >>> len(position.pack()), unpack(position.pack()) == position
+    (11, True)
+    """
+    if not 0 <= self.halfmoves <= MAX_HALFMOVES:
+      raise ValueError(f"Halfmove count {self.halfmoves} does not fit in a packed position")
+    nibbles = self.squares.translate(_TO_NIBBLE)
+    packed = bytearray(map(_pack_pair, nibbles[0::2], nibbles[1::2]))
+    packed.append(self.color << 7 | self.halfmoves)
+    return bytes(packed)
+
+
+class PositionView:
+  """One bitboard per FEN character and an occupancy mask per color, as Board
+  keeps them, for a position's squares.
+  """
+  __slots__ = ("bitboards", "occupancy")
+
+  def __init__(self, squares: bytes) -> None:
+    bitboards = dict.fromkeys(_CODES, 0)
+    occupancy = [0, 0]
+    for sq, code in enumerate(squares):
+      if code:
+        bit = 1 << sq
+        bitboards[_CHARS[code]] |= bit
+        occupancy[code > 6] |= bit
+    self.bitboards = bitboards
+    self.occupancy = occupancy
+
+
+def _pack_pair(low: int, high: int) -> int:
+  return low | high << 4
+
+
+def unpack(data: bytes) -> Position:
+  """Read a position written by Position.pack.
+  """
+  if len(data) != PACKED_SIZE:
+    raise ValueError(f"Expected {PACKED_SIZE} bytes for a packed position, got {len(data)}")
+  squares = b"".join(map(_UNPACKED.__getitem__, data[:-1]))
+  return Position(squares, data[-1] >> 7, data[-1] & MAX_HALFMOVES)
+
+
+def parse_fen(fen: str) -> Position:
+  """Read a FEN position, with optional side to move and halfmove count.
+
+  >>> parse_fen("knbr/p3/4/3P/RBNK").fen()
+  'knbr/p3/4/3P/RBNK w 0'
+  >>> parse_fen("knbr/p3/4/3P/RBN w")
+  Traceback (most recent call last):
+    ...
+  ValueError: Expected 4 squares in FEN row RBN: knbr/p3/4/3P/RBN w
+  """
+  fields = fen.split()
+  if not 1 <= len(fields) <= 3:
+    raise ValueError(f"Expected pieces, side to move and halfmove count in FEN: {fen}")
+  rows = fields[0].split("/")
+  if len(rows) != ROW_SIZE:
+    raise ValueError(f"Expected {ROW_SIZE} rows in FEN: {fen}")
+
+  squares = bytearray()
+  for row in rows:
+    start = len(squares)
+    for c in row:
+      if c.isdigit():
+        squares.extend(bytes(int(c)))
+      elif c in _CODES:
+        squares.append(_CODES[c])
+      else:
+        raise ValueError(f"Unknown piece {c!r} in FEN: {fen}")
+    if len(squares) - start != COL_SIZE:
+      raise ValueError(f"Expected {COL_SIZE} squares in FEN row {row}: {fen}")
+
+  side = fields[1] if len(fields) > 1 else "w"
+  if side not in ("w", "b"):
+    raise ValueError(f"Expected w or b for the side to move in FEN: {fen}")
+  halfmoves = fields[2] if len(fields) > 2 else "0"
+  if not halfmoves.isdigit():
+    raise ValueError(f"Expected a halfmove count in FEN: {fen}")
+  return Position(bytes(squares), WHITE if side == "w" else BLACK, int(halfmoves))
+
+
+def pieces(position: Position) -> Iterator[tuple[int, str]]:
+  """Yield (square, FEN character) for every piece in position.
+  """
+  for sq, code in enumerate(position.squares):
+    if code:
+      yield sq, _CHARS[code]
@@ -0,0 +1,109 @@
+"""Counters and timers for one MinimaxAgent.get_move, collected on request.
+
+The agent only pays for what it measures: with stats off nothing here is
+called. With them on, the search sends its move generation, check tests and
+evaluations through a SearchStats, which times them, and reports its cutoffs
+and iterations.
+"""
+import time
+from typing import *
+from bitboard import in_check
+
+# Parts of the search that are timed separately
+TIMED = ("movegen", "check", "eval")
+
+
+class SearchStats:
+  """What one search spent its nodes and time on; as_dict is the report.
+
+  >>> from game import Game
+  >>> from movecache import MoveCache
+  >>> from tables import WHITE
+  >>> board = Game(None, None).board
+  >>> stats, cache = SearchStats(), MoveCache()
+  >>> len(stats.legal_moves(cache, board, WHITE)), len(stats.legal_moves(cache, board, WHITE))
+  (11, 11)
+  >>> stats.cutoff(2)
+  >>> report = stats.as_dict(nodes=10, tt_hits=4)
+  >>> report["move_lookups"], report["movegen_calls"], report["move_cache_hits"], report["cutoffs"]
+  (2, 1, 1, {2: 1})
+  """
+
+  def __init__(self) -> None:
+    self.start = time.perf_counter()
+    self.calls = dict.fromkeys(TIMED, 0)
+    self.seconds = dict.fromkeys(TIMED, 0.0)
+    # Move list lookups, of which calls["movegen"] missed the cache and
+    # generated moves_generated moves between them
+    self.lookups = 0
+    self.moves_generated = 0
+    # Cutoffs by remaining depth; quiescence counts as depth 0
+    self.cutoffs = {}
+    # (depth, nodes, seconds) of each finished iteration
+    self.iterations = []
+
+  def legal_moves(self, cache, board, color: int) -> tuple[tuple[int, int], ...]:
+    """cache.legal_moves(board, color), timed, telling cache hits from generated lists.
+    """
+    misses = cache.misses
+    start = time.perf_counter()
+    moves = cache.legal_moves(board, color)
+    self.seconds["movegen"] += time.perf_counter() - start
+    self.lookups += 1
+    if cache.misses != misses:
+      self.calls["movegen"] += 1
+      self.moves_generated += len(moves)
+    return moves
+
+  def in_check(self, board, color: int) -> bool:
+    start = time.perf_counter()
+    checked = in_check(board, color)
+    self.seconds["check"] += time.perf_counter() - start
+    self.calls["check"] += 1
+    return checked
+
+  def evaluate(self, eval_func, board) -> float:
+    start = time.perf_counter()
+    score = eval_func(board)
+    self.seconds["eval"] += time.perf_counter() - start
+    self.calls["eval"] += 1
+    return score
+
+  def cutoff(self, depth: int) -> None:
+    self.cutoffs[depth] = self.cutoffs.get(depth, 0) + 1
+
+  def iteration(self, depth: int, nodes: int) -> None:
+    self.iterations.append((depth, nodes, time.perf_counter() - self.start))
+
+  def as_dict(self, nodes: int, tt_hits: int) -> dict:
+    total = time.perf_counter() - self.start
+    iterations = []
+    previous_nodes, previous_seconds = 0, 0.0
+    for depth, iteration_nodes, seconds in self.iterations:
+      iterations.append({"depth": depth, "nodes": iteration_nodes - previous_nodes,
+                         "seconds": round(seconds - previous_seconds, 6)})
+      previous_nodes, previous_seconds = iteration_nodes, seconds
+    # How many times more nodes each extra ply of depth cost
+    effective = None
+    if len(iterations) >= 2 and iterations[-2]["nodes"] > 0:
+      effective = round(iterations[-1]["nodes"] / iterations[-2]["nodes"], 2)
+
+    seconds = {name: round(self.seconds[name], 6) for name in TIMED}
+    seconds["other"] = round(max(total - sum(self.seconds.values()), 0.0), 6)
+    seconds["total"] = round(total, 6)
+    return {
+        "nodes": nodes,
+        "nodes_per_second": round(nodes / total) if total > 0 else 0,
+        "evals": self.calls["eval"],
+        "move_lookups": self.lookups,
+        "movegen_calls": self.calls["movegen"],
+        "move_cache_hits": self.lookups - self.calls["movegen"],
+        "check_tests": self.calls["check"],
+        "tt_hits": tt_hits,
+        "cutoffs": dict(sorted(self.cutoffs.items())),
+        # Legal moves per generated position
+        "branching_factor": round(self.moves_generated / max(self.calls["movegen"], 1), 2),
+        "effective_branching_factor": effective,
+        "iterations": iterations,
+        "seconds": seconds,
+    }
@@ -0,0 +1,84 @@
+"""Per-game state for the web server.
+
+Each browser tab plays its own game, identified by a game id. The store keeps
+at most max_games of them and evicts the least recently used one when full, so
+memory stays bounded however many games are abandoned.
+
+In player vs computer games the AI's reply is searched in a worker process;
+the session only holds the pending future until the reply is collected.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+from typing import *
+from game import Game
+from position import Position
+
+WHITE, BLACK = 0, 1
+
+
+class GameSession:
+  def __init__(self, game_id: str, is_1v1: bool) -> None:
+    self.game_id = game_id
+    self.is_1v1 = is_1v1
+    # Serializes requests for the same game
+    self.lock = threading.Lock()
+    self.reset()
+
+  def reset(self, is_1v1: Optional[bool] = None) -> None:
+    if is_1v1 is not None:
+      self.is_1v1 = is_1v1
+    self.game = Game(None, None)
+    self.white_turn = True
+    self.move_count = 0
+    # A reply still being searched belongs to the old game
+    if getattr(self, "pending", None) is not None:
+      self.pending.cancel()
+    # Future for the AI's reply while it is being searched
+    self.pending = None
+
+  def position(self, color: int) -> Position:
+    """The game's position with color to move and the moves played so far.
+    """
+    return Position.from_board(self.game.board, color, self.move_count)
+
+  def toggle_mode(self) -> None:
+    """Switch between player vs player and player vs computer from the next reset.
+    """
+    self.is_1v1 = not self.is_1v1
+
+
+class GameStore:
+  """Thread-safe map of game id to GameSession with LRU eviction.
+
+  >>> store = GameStore(max_games=2)
+  >>> first, second = store.create(), store.create()
+  >>> store.get(first.game_id) is first
+  True
+  >>> third = store.create()
+  >>> store.get(second.game_id) is None, len(store)
+  (True, 2)
+  """
+
+  def __init__(self, max_games: int = 1000) -> None:
+    self.max_games = max_games
+    self.games = OrderedDict()
+    self.lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return len(self.games)
+
+  def create(self, is_1v1: bool = True) -> GameSession:
+    session = GameSession(uuid.uuid4().hex, is_1v1)
+    with self.lock:
+      self.games[session.game_id] = session
+      while len(self.games) > self.max_games:
+        self.games.popitem(last=False)
+    return session
+
+  def get(self, game_id: Optional[str]) -> Optional[GameSession]:
+    with self.lock:
+      session = self.games.get(game_id)
+      if session is not None:
+        self.games.move_to_end(game_id)
+    return session
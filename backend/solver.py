@@ -0,0 +1,382 @@
+"""Strong solver for MicroChess: every position reachable from the start, solved.
+
+Positions are split into slices by their material and pawn squares. Captures
+and pawn moves can't be undone and every other move keeps both, so a move
+either stays in its slice or goes to a slice of higher rank (see slice_rank).
+That lets the slices be handled one at a time, on disk:
+
+1. Enumerate, in rank order: flood each slice from the positions that enter
+   it, write its positions, sorted by their packed form, to
+   ``positions/<slice>.pos``, and hand the positions it reaches in later
+   slices to those slices as seeds.
+2. Solve, in reverse rank order: retrograde analysis within each slice, with
+   moves into later slices scored from their finished ``values/<slice>.val``.
+
+A value is two bytes per position, aligned with the .pos file: 0 for a draw,
+otherwise the distance to mate in plies plus one, odd distances being wins for
+the side to move like in tablebase. Games are scored with the rules of
+Game.is_game_over except the 50 move limit.
+
+Slices of the same rank don't depend on each other and are handed to a pool
+of processes. Every finished slice is recorded in ``manifest.json``, so an
+interrupted run picks up where it stopped::
+
+    python solver.py --out solution --processes 8
+    python solver.py --fen "k3/p3/4/3P/3K w" --out small
+
+Solution reads the result back with the same probe interface as Tablebase, so
+MinimaxAgent can play every position from it without searching.
+"""
+import argparse
+import json
+import mmap
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import *
+from bitboard import legal_moves, in_check, insufficient_material, PIECE_CODES
+from position import Position, parse_fen, unpack, pieces, PACKED_SIZE
+from tables import WHITE, BLACK, ROW_SIZE, COL_SIZE
+from tablebase import MATERIAL_ORDER, WIN, DRAW, LOSS
+
+STARTING_FEN = "knbr/p3/4/3P/RBNK w"
+SOLUTION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solution")
+MANIFEST = "manifest.json"
+# Rank gained by losing a piece, more than any pawn can lose by being captured
+CAPTURE_RANK = ROW_SIZE
+# Slice files kept open per process while probing
+OPEN_SLICES = 64
+# Square codes of pawns in a position's squares
+_PAWNS = (PIECE_CODES["P"] & 0xFF, PIECE_CODES["p"] & 0xFF)
+
+
+def slice_name(position: Position) -> str:
+  """The slice position belongs to: its material, then its pawn squares.
+
+  >>> slice_name(parse_fen(STARTING_FEN))
+  'KRBNPkrbnp_15-4'
+  """
+  placed = sorted((MATERIAL_ORDER.index(char), sq) for sq, char in pieces(position))
+  material = "".join(MATERIAL_ORDER[order] for order, _ in placed)
+  pawns = "-".join(str(sq) for order, sq in placed if MATERIAL_ORDER[order] in "Pp")
+  return f"{material}_{pawns}"
+
+
+def slice_rank(name: str, pieces: int) -> int:
+  """How far a slice is from the start of a game with pieces pieces; every
+  move out of a slice goes to one of higher rank.
+
+  >>> slice_rank('KRBNPkrbnp_15-4', 10), slice_rank('KRBNPkrbnp_11-4', 10)
+  (0, 1)
+  """
+  material, pawns = name.split("_")
+  advanced = 0
+  pawn_chars = [char for char in material if char in "Pp"]
+  for char, sq in zip(pawn_chars, pawns.split("-") if pawns else []):
+    row = int(sq) // COL_SIZE
+    advanced += ROW_SIZE - 1 - row if char == "P" else row
+  # Pawns start one row in, on their own side's second rank
+  advanced -= len(pawn_chars)
+  return (pieces - len(material)) * CAPTURE_RANK + advanced
+
+
+def key(position: Position) -> bytes:
+  """The packed position without its halfmove count, which the solution ignores.
+  """
+  return Position(position.squares, position.color).pack()
+
+
+def _leaves_slice(position: Position, move: tuple[int, int]) -> bool:
+  """Whether move captures or moves a pawn, which takes it to another slice.
+  """
+  from_sq, to_sq = move
+  return position.squares[to_sq] != 0 or position.squares[from_sq] in _PAWNS
+
+
+def _write(path: str, data: bytes) -> None:
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path + ".tmp", "wb") as f:
+    f.write(data)
+  os.replace(path + ".tmp", path)
+
+
+def _read_keys(path: str) -> list[bytes]:
+  with open(path, "rb") as f:
+    data = f.read()
+  return [data[i:i + PACKED_SIZE] for i in range(0, len(data), PACKED_SIZE)]
+
+
+def enumerate_slice(out: str, name: str) -> tuple[int, dict[str, int]]:
+  """Flood a slice from its seeds and write its positions.
+
+  Returns how many positions it has and the number of seeds handed to each
+  later slice, by name.
+  """
+  seed_dir = os.path.join(out, "seeds", name)
+  seen = set()
+  for seed_file in os.listdir(seed_dir):
+    seen.update(_read_keys(os.path.join(seed_dir, seed_file)))
+
+  stack = list(seen)
+  exits = {}
+  while stack:
+    position = unpack(stack.pop())
+    view = position.view()
+    if insufficient_material(view):
+      continue
+    for move in legal_moves(view, position.color):
+      child = key(position.push(move))
+      if _leaves_slice(position, move):
+        exits.setdefault(slice_name(unpack(child)), set()).add(child)
+      elif child not in seen:
+        seen.add(child)
+        stack.append(child)
+
+  for child_name, children in exits.items():
+    _write(os.path.join(out, "seeds", child_name, f"{name}.seed"), b"".join(sorted(children)))
+  _write(os.path.join(out, "positions", f"{name}.pos"), b"".join(sorted(seen)))
+  return len(seen), {child_name: len(children) for child_name, children in exits.items()}
+
+
+class SliceTable:
+  """A finished slice's sorted positions and values, memory-mapped.
+  """
+
+  def __init__(self, out: str, name: str) -> None:
+    with open(os.path.join(out, "positions", f"{name}.pos"), "rb") as f:
+      self.positions = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with open(os.path.join(out, "values", f"{name}.val"), "rb") as f:
+      self.values = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    self.size = len(self.positions) // PACKED_SIZE
+
+  def lookup(self, packed: bytes) -> Optional[int]:
+    positions = self.positions
+    low, high = 0, self.size
+    while low < high:
+      mid = (low + high) // 2
+      if positions[mid * PACKED_SIZE:(mid + 1) * PACKED_SIZE] < packed:
+        low = mid + 1
+      else:
+        high = mid
+    if low == self.size or positions[low * PACKED_SIZE:(low + 1) * PACKED_SIZE] != packed:
+      return None
+    return int.from_bytes(self.values[low * 2:low * 2 + 2], "little")
+
+
+def decode(value: int) -> tuple[int, int]:
+  """Turn a stored value into (WIN/DRAW/LOSS, distance to mate) for the side to move.
+
+  >>> decode(0), decode(1), decode(4)
+  ((0, 0), (-1, 0), (1, 3))
+  """
+  if value == 0:
+    return (DRAW, 0)
+  dtm = value - 1
+  return (WIN if dtm % 2 else LOSS, dtm)
+
+
+def solve_slice(out: str, name: str) -> int:
+  """Solve a slice by retrograde analysis once every later slice it reaches is
+  solved, write its values and return how many of its positions are wins.
+  """
+  keys = _read_keys(os.path.join(out, "positions", f"{name}.pos"))
+  index = {packed: i for i, packed in enumerate(keys)}
+  size = len(keys)
+  values = array("H", bytes(2 * size))
+  remaining = array("i", bytes(4 * size))
+  resolved = bytearray(size)
+  parents = [[] for _ in range(size)]
+  # events[d] holds (parent, child_lost) pairs learned at distance d
+  events = [[]]
+  tables = {}
+
+  def add_event(dtm: int, parent: int, child_lost: bool) -> None:
+    while len(events) <= dtm:
+      events.append([])
+    events[dtm].append((parent, child_lost))
+
+  mated = []
+  for i, packed in enumerate(keys):
+    position = unpack(packed)
+    view = position.view()
+    # Game.is_game_over checks material before looking for mate
+    if insufficient_material(view):
+      resolved[i] = 1
+      continue
+    moves = legal_moves(view, position.color)
+    if len(moves) == 0:
+      resolved[i] = 1
+      if in_check(view, position.color):
+        mated.append(i)
+      continue
+
+    remaining[i] = len(moves)
+    for move in moves:
+      child = key(position.push(move))
+      if _leaves_slice(position, move):
+        child_name = slice_name(unpack(child))
+        if child_name not in tables:
+          tables[child_name] = SliceTable(out, child_name)
+        wdl, dtm = decode(tables[child_name].lookup(child))
+        if wdl != DRAW:
+          add_event(dtm, i, wdl == LOSS)
+      else:
+        parents[index[child]].append(i)
+
+  def solve(i: int, dtm: int) -> None:
+    resolved[i] = 1
+    values[i] = dtm + 1
+    lost = dtm % 2 == 0
+    for parent in parents[i]:
+      add_event(dtm, parent, lost)
+
+  for i in mated:
+    solve(i, 0)
+
+  dtm = 0
+  while dtm < len(events):
+    for parent, child_lost in events[dtm]:
+      if resolved[parent]:
+        continue
+      if child_lost:
+        solve(parent, dtm + 1)
+      else:
+        remaining[parent] -= 1
+        if remaining[parent] == 0:
+          solve(parent, dtm + 1)
+    events[dtm] = None
+    dtm += 1
+
+  _write(os.path.join(out, "values", f"{name}.val"), values.tobytes())
+  return sum(1 for value in values if value and value % 2 == 0)
+
+
+class Solver:
+  """Runs and resumes a solve into the out directory.
+
+  >>> Solver("unused", "k3/4/4/1r2/R2K w")
+  Traceback (most recent call last):
+    ...
+  ValueError: Illegal position, the side not to move is in check: k3/4/4/1r2/R2K w
+  """
+
+  def __init__(self, out: str, fen: str = STARTING_FEN, processes: Optional[int] = None) -> None:
+    self.out = out
+    self.processes = processes or os.cpu_count() or 1
+    path = os.path.join(out, MANIFEST)
+    if os.path.exists(path):
+      with open(path) as f:
+        self.manifest = json.load(f)
+      if self.manifest["root"] != fen:
+        raise ValueError(f"{out} holds a solve of {self.manifest['root']}, not {fen}")
+      return
+
+    root = parse_fen(fen)
+    # The side that just moved can't have left its king in check
+    if in_check(root.view(), 1 - root.color):
+      raise ValueError(f"Illegal position, the side not to move is in check: {fen}")
+    name = slice_name(root)
+    count = len(name.split("_")[0])
+    self.manifest = {"root": fen, "pieces": count, "slices": {name: slice_rank(name, count)},
+                     "enumerated": {}, "solved": {}}
+    _write(os.path.join(out, "seeds", name, "root.seed"), key(root))
+    self.save()
+
+  def save(self) -> None:
+    _write(os.path.join(self.out, MANIFEST), json.dumps(self.manifest, indent=1, sort_keys=True).encode())
+
+  def _run(self, task, names: list[str], executor) -> Iterator[tuple[str, Any]]:
+    futures = {name: executor.submit(task, self.out, name) for name in names}
+    for name, future in futures.items():
+      yield name, future.result()
+
+  def enumerate(self, executor, log=print) -> None:
+    manifest = self.manifest
+    while True:
+      pending = [name for name in manifest["slices"] if name not in manifest["enumerated"]]
+      if not pending:
+        return
+      # Seeds only come from lower ranks, which are all done by now
+      rank = min(manifest["slices"][name] for name in pending)
+      batch = [name for name in pending if manifest["slices"][name] == rank]
+      for name, (count, exits) in self._run(enumerate_slice, batch, executor):
+        manifest["enumerated"][name] = count
+        for child_name in exits:
+          manifest["slices"].setdefault(child_name, slice_rank(child_name, manifest["pieces"]))
+        self.save()
+      log(f"enumerated rank {rank}: {len(batch)} slices, {len(manifest['enumerated'])} of "
+          f"{len(manifest['slices'])} done, {sum(manifest['enumerated'].values())} positions")
+
+  def solve(self, executor, log=print) -> None:
+    manifest = self.manifest
+    ranks = sorted({manifest["slices"][name] for name in manifest["slices"]}, reverse=True)
+    for rank in ranks:
+      batch = [name for name, r in manifest["slices"].items() if r == rank and name not in manifest["solved"]]
+      for name, wins in self._run(solve_slice, batch, executor):
+        manifest["solved"][name] = wins
+        self.save()
+      if batch:
+        log(f"solved rank {rank}: {len(batch)} slices, {len(manifest['solved'])} of {len(manifest['slices'])} done")
+
+  def run(self, log=print) -> None:
+    with ProcessPoolExecutor(max_workers=self.processes) as executor:
+      self.enumerate(executor, log)
+      self.solve(executor, log)
+
+
+class Solution:
+  """A finished solve, probed like a Tablebase. It is empty unless the solve
+  in directory completed.
+  """
+
+  def __init__(self, directory: str = SOLUTION_DIR) -> None:
+    self.directory = directory
+    self.slices = {}
+    self.tables = {}
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+      return
+    with open(path) as f:
+      manifest = json.load(f)
+    if len(manifest["solved"]) == len(manifest["slices"]):
+      self.slices = manifest["slices"]
+
+  def __len__(self) -> int:
+    return len(self.slices)
+
+  def probe(self, board, color: int) -> Optional[tuple[int, int]]:
+    """(WIN/DRAW/LOSS, distance to mate) for color to move, or None if the
+    position can't be reached from the solved root.
+    """
+    position = Position.from_board(board, color)
+    name = slice_name(position)
+    if name not in self.slices:
+      return None
+    table = self.tables.get(name)
+    if table is None:
+      if len(self.tables) >= OPEN_SLICES:
+        self.tables.pop(next(iter(self.tables)))
+      table = self.tables[name] = SliceTable(self.directory, name)
+    value = table.lookup(key(position))
+    return None if value is None else decode(value)
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description="Solve MicroChess from a position, resuming an earlier run")
+  parser.add_argument("--fen", default=STARTING_FEN, help="position to solve, with optional side to move")
+  parser.add_argument("--out", default=SOLUTION_DIR, help="directory to keep the solve in")
+  parser.add_argument("--processes", type=int, default=os.cpu_count())
+  args = parser.parse_args()
+
+  solver = Solver(args.out, args.fen, args.processes)
+  solver.run()
+  root = parse_fen(args.fen)
+  wdl, dtm = decode(SliceTable(args.out, slice_name(root)).lookup(key(root)))
+  positions = sum(solver.manifest["enumerated"].values())
+  slices = len(solver.manifest["slices"])
+  result = {WIN: f"side to move wins in {dtm} plies", LOSS: f"side to move loses in {dtm} plies", DRAW: "draw"}[wdl]
+  print(f"{args.fen}: {result} ({positions} positions in {slices} slices)")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,289 @@
+"""Endgame tablebases for MicroChess.
+
+A table covers one material set, written as its FEN characters in
+``MATERIAL_ORDER`` (e.g. ``"KRk"``), and stores one byte per position:
+
+  0         draw
+  1..253    distance to mate in plies plus one; odd distances are wins for the
+            side to move, even ones losses
+  255       unreachable (two pieces on a square, or the side not to move in check)
+
+A position's index is its piece squares read as base-20 digits, in material
+order, followed by the side to move. Games are scored with the rules of
+``Game.is_game_over`` except the 50 move limit.
+
+Tables are built offline by retrograde analysis and written as ``<material>.mctb``
+files, which ``Tablebase`` memory-maps so probing is a single byte read::
+
+    python tablebase.py KRk KRkn --out tablebases
+"""
+import argparse
+import itertools
+import mmap
+import os
+from array import array
+from typing import *
+from board import Board
+from bitboard import legal_moves, in_check, insufficient_material
+from tables import NUM_SQUARES, ROW_SIZE, COL_SIZE, WHITE, BLACK
+
+MATERIAL_ORDER = "KQRBNPkqrbnp"
+MAGIC = b"MCTB"
+VERSION = 1
+DRAW_BYTE = 0
+INVALID_BYTE = 255
+MAX_DTM = 252
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+
+WIN, DRAW, LOSS = 1, 0, -1
+
+
+def canonical(material: str) -> str:
+  """Sort a material string into MATERIAL_ORDER.
+
+  >>> canonical("kRK")
+  'KRk'
+  """
+  if material.count("K") != 1 or material.count("k") != 1 or any(c not in MATERIAL_ORDER for c in material):
+    raise ValueError(f"Invalid material set: {material}")
+  return "".join(sorted(material, key=MATERIAL_ORDER.index))
+
+
+def board_material(board) -> str:
+  bb = board.bitboards
+  return "".join(char * bb[char].bit_count() for char in MATERIAL_ORDER)
+
+
+def board_index(board, color: int) -> int:
+  """Index of the board with color to move in the table for its material.
+  """
+  bb = board.bitboards
+  index = 0
+  for char in MATERIAL_ORDER:
+    mask = bb[char]
+    while mask:
+      low = mask & -mask
+      index = index * NUM_SQUARES + low.bit_length() - 1
+      mask ^= low
+  return index * 2 + color
+
+
+def decode(value: int) -> Optional[tuple[int, int]]:
+  """Turn a stored byte into (WIN/DRAW/LOSS, distance to mate) for the side to move.
+
+  >>> decode(0), decode(1), decode(4)
+  ((0, 0), (-1, 0), (1, 3))
+  """
+  if value == INVALID_BYTE:
+    return None
+  if value == DRAW_BYTE:
+    return (DRAW, 0)
+  dtm = value - 1
+  return (WIN if dtm % 2 else LOSS, dtm)
+
+
+def _index(squares, color: int) -> int:
+  index = 0
+  for sq in squares:
+    index = index * NUM_SQUARES + sq
+  return index * 2 + color
+
+
+def _set_up(board: Board, material: str, squares) -> None:
+  bitboards = board.bitboards
+  for char in MATERIAL_ORDER:
+    bitboards[char] = 0
+  occupancy = [0, 0]
+  for char, sq in zip(material, squares):
+    bitboards[char] |= 1 << sq
+    occupancy[BLACK if char.islower() else WHITE] |= 1 << sq
+  board.occupancy = occupancy
+
+
+def generate(material: str, tables: Optional[dict] = None) -> bytearray:
+  """Solve every position of a material set by retrograde analysis.
+
+  Tables for the material sets reachable by captures are generated first and
+  kept in tables, keyed by material.
+
+  >>> tables = {}
+  >>> krk = generate("KRk", tables)
+  >>> sorted(tables)
+  ['KRk', 'Kk']
+  >>> # Black king cornered on a8 by the white king and a rook on the back rank
+  >>> decode(krk[_index((8, 3, 0), BLACK)])
+  (-1, 0)
+  >>> decode(krk[_index((8, 7, 0), WHITE)])
+  (1, 1)
+  """
+  material = canonical(material)
+  tables = {} if tables is None else tables
+  if material in tables:
+    return tables[material]
+
+  # Every capture removes one non-king piece
+  for i, char in enumerate(material):
+    if char not in "Kk":
+      generate(material[:i] + material[i + 1:], tables)
+
+  n = len(material)
+  size = NUM_SQUARES ** n * 2
+  values = bytearray(size)
+  remaining = array("i", bytes(4 * size))
+  resolved = bytearray(size)
+  edge_from, edge_to = array("i"), array("i")
+  # events[d] holds (parent, child_lost) pairs learned at distance d
+  events = [[] for _ in range(MAX_DTM + 1)]
+  board = Board(ROW_SIZE, COL_SIZE)
+  mated = []
+
+  for index, squares in enumerate(itertools.product(range(NUM_SQUARES), repeat=n)):
+    for color in (WHITE, BLACK):
+      position = index * 2 + color
+      if len(set(squares)) < n:
+        values[position] = INVALID_BYTE
+        resolved[position] = 1
+        continue
+
+      _set_up(board, material, squares)
+      if in_check(board, 1 - color):
+        values[position] = INVALID_BYTE
+        resolved[position] = 1
+        continue
+      # Game.is_game_over checks material before looking for mate
+      if insufficient_material(board):
+        resolved[position] = 1
+        continue
+
+      moves = legal_moves(board, color)
+      if len(moves) == 0:
+        resolved[position] = 1
+        if in_check(board, color):
+          mated.append(position)
+        continue
+
+      remaining[position] = len(moves)
+      slots = {sq: i for i, sq in enumerate(squares)}
+      for from_sq, to_sq in moves:
+        child = list(squares)
+        child[slots[from_sq]] = to_sq
+        if to_sq in slots:
+          # Captures land in a smaller table, which is already solved
+          captured = slots[to_sq]
+          child_material = material[:captured] + material[captured + 1:]
+          del child[captured]
+          result = decode(tables[child_material][_index(child, 1 - color)])
+          if result is not None and result[0] != DRAW:
+            events[result[1]].append((position, result[0] == LOSS))
+        else:
+          edge_from.append(position)
+          edge_to.append(_index(child, 1 - color))
+
+  # Invert the move graph so each solved position can notify its parents
+  starts = array("i", bytes(4 * (size + 1)))
+  for child in edge_to:
+    starts[child + 1] += 1
+  for i in range(size):
+    starts[i + 1] += starts[i]
+  fill = array("i", starts)
+  parents = array("i", bytes(4 * len(edge_to)))
+  for parent, child in zip(edge_from, edge_to):
+    parents[fill[child]] = parent
+    fill[child] += 1
+  del edge_from, edge_to, fill
+  board = None
+
+  def solve(position: int, dtm: int) -> None:
+    resolved[position] = 1
+    values[position] = dtm + 1
+    if dtm < MAX_DTM:
+      lost = dtm % 2 == 0
+      for i in range(starts[position], starts[position + 1]):
+        events[dtm].append((parents[i], lost))
+
+  # Mated positions were found during the forward pass
+  for position in mated:
+    solve(position, 0)
+
+  for dtm in range(MAX_DTM):
+    for parent, child_lost in events[dtm]:
+      if resolved[parent]:
+        continue
+      if child_lost:
+        solve(parent, dtm + 1)
+      else:
+        remaining[parent] -= 1
+        if remaining[parent] == 0:
+          solve(parent, dtm + 1)
+    events[dtm] = None
+
+  tables[material] = values
+  return values
+
+
+def write_table(directory: str, material: str, values: bytes) -> str:
+  os.makedirs(directory, exist_ok=True)
+  path = os.path.join(directory, f"{material}.mctb")
+  with open(path, "wb") as f:
+    f.write(MAGIC + bytes([VERSION, len(material)]) + material.encode("ascii"))
+    f.write(values)
+  return path
+
+
+class Tablebase:
+  """Memory-mapped tablebase files from one directory.
+  """
+
+  def __init__(self, directory: str = TABLEBASE_DIR) -> None:
+    self.tables = {}
+    self.max_pieces = 0
+    if not os.path.isdir(directory):
+      return
+    for name in sorted(os.listdir(directory)):
+      if name.endswith(".mctb"):
+        self.load(os.path.join(directory, name))
+
+  def load(self, path: str) -> None:
+    with open(path, "rb") as f:
+      data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if data[:4] != MAGIC or data[4] != VERSION:
+      raise ValueError(f"{path} is not a MicroChess tablebase")
+    length = data[5]
+    material = data[6:6 + length].decode("ascii")
+    self.tables[material] = (data, 6 + length)
+    self.max_pieces = max(self.max_pieces, len(material))
+
+  def __len__(self) -> int:
+    return len(self.tables)
+
+  def probe(self, board, color: int) -> Optional[tuple[int, int]]:
+    """(WIN/DRAW/LOSS, distance to mate) for color to move, or None if no table covers the board.
+    """
+    if (board.occupancy[WHITE] | board.occupancy[BLACK]).bit_count() > self.max_pieces:
+      return None
+    table = self.tables.get(board_material(board))
+    if table is None:
+      return None
+    data, offset = table
+    return decode(data[offset + board_index(board, color)])
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description="Generate MicroChess endgame tablebases")
+  parser.add_argument("materials", nargs="+", help="material sets such as KRk or KRkn")
+  parser.add_argument("--out", default=TABLEBASE_DIR, help="directory to write .mctb files to")
+  args = parser.parse_args()
+
+  tables = {}
+  for material in args.materials:
+    generate(material, tables)
+  for material, values in tables.items():
+    results = [decode(v) for v in values]
+    wins = sum(1 for r in results if r is not None and r[0] == WIN)
+    longest = max((r[1] for r in results if r is not None), default=0)
+    path = write_table(args.out, material, values)
+    print(f"{material}: {len(values)} positions, {wins} wins, longest mate {longest} plies -> {path}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,105 @@
+"""Precomputed move tables for the 5x4 MicroChess board.
+
+Everything here is built once at import time. Squares are indexed row-major,
+so (row, col) is square ``row * COL_SIZE + col``. Tables are indexed by square
+and hold either positions (for the ``Piece`` classes) or bitboard masks (for
+``bitboard``), built from the same geometry.
+"""
+from typing import *
+
+WHITE, BLACK = 0, 1
+ROW_SIZE, COL_SIZE = 5, 4
+NUM_SQUARES = ROW_SIZE * COL_SIZE
+ALL_SQUARES = (1 << NUM_SQUARES) - 1
+
+KING_OFFSETS = ((1, 0), (0, 1), (-1, 0), (0, -1),
+                (1, 1), (1, -1), (-1, 1), (-1, -1))
+KNIGHT_OFFSETS = ((1, 2), (1, -2), (-1, 2), (-1, -2),
+                  (2, 1), (2, -1), (-2, 1), (-2, -1))
+# Sliding directions: the first four are orthogonal, the last four diagonal
+DIRECTIONS = KING_OFFSETS
+ORTHOGONAL = (0, 1, 2, 3)
+DIAGONAL = (4, 5, 6, 7)
+
+POSITIONS = tuple(divmod(sq, COL_SIZE) for sq in range(NUM_SQUARES))
+
+
+def square(pos: tuple[int, int]) -> int:
+  return pos[0] * COL_SIZE + pos[1]
+
+
+def position(sq: int) -> tuple[int, int]:
+  return POSITIONS[sq]
+
+
+def _on_board(row: int, col: int) -> bool:
+  return 0 <= row < ROW_SIZE and 0 <= col < COL_SIZE
+
+
+def _targets(sq: int, offsets) -> tuple[tuple[int, int], ...]:
+  row, col = POSITIONS[sq]
+  return tuple((row + dr, col + dc) for dr, dc in offsets if _on_board(row + dr, col + dc))
+
+
+def _ray(sq: int, direction: tuple[int, int]) -> tuple[tuple[int, int], ...]:
+  ray = []
+  row, col = POSITIONS[sq]
+  row, col = row + direction[0], col + direction[1]
+  while _on_board(row, col):
+    ray.append((row, col))
+    row, col = row + direction[0], col + direction[1]
+  return tuple(ray)
+
+
+def _mask(positions) -> int:
+  mask = 0
+  for pos in positions:
+    mask |= 1 << square(pos)
+  return mask
+
+
+KNIGHT_TARGETS = tuple(_targets(sq, KNIGHT_OFFSETS) for sq in range(NUM_SQUARES))
+KING_TARGETS = tuple(_targets(sq, KING_OFFSETS) for sq in range(NUM_SQUARES))
+# White pawns move towards row 0, black pawns towards the last row
+PAWN_CAPTURES = (
+    tuple(_targets(sq, ((-1, 1), (-1, -1))) for sq in range(NUM_SQUARES)),
+    tuple(_targets(sq, ((1, 1), (1, -1))) for sq in range(NUM_SQUARES)),
+)
+# The square in front of a pawn, or None on the last row
+PAWN_PUSH = (
+    tuple((_targets(sq, ((-1, 0),)) or (None,))[0] for sq in range(NUM_SQUARES)),
+    tuple((_targets(sq, ((1, 0),)) or (None,))[0] for sq in range(NUM_SQUARES)),
+)
+# RAYS[sq][direction] lists the squares walked from sq, nearest first
+RAYS = tuple(tuple(_ray(sq, d) for d in DIRECTIONS) for sq in range(NUM_SQUARES))
+ORTHOGONAL_RAYS = tuple(rays[:4] for rays in RAYS)
+DIAGONAL_RAYS = tuple(rays[4:] for rays in RAYS)
+
+
+def _line(a: int, b: int) -> tuple[tuple[int, int], ...]:
+  target = POSITIONS[b]
+  for ray in RAYS[a]:
+    if target in ray:
+      return ray[:ray.index(target) + 1]
+  return ()
+
+
+# LINES[a][b] walks from a (exclusive) to b (inclusive) when they share a rank,
+# file or diagonal, and is empty otherwise
+LINES = tuple(tuple(_line(a, b) for b in range(NUM_SQUARES)) for a in range(NUM_SQUARES))
+
+KNIGHT_ATTACKS = tuple(_mask(targets) for targets in KNIGHT_TARGETS)
+KING_ATTACKS = tuple(_mask(targets) for targets in KING_TARGETS)
+PAWN_ATTACKS = tuple(tuple(_mask(targets) for targets in PAWN_CAPTURES[color])
+                     for color in (WHITE, BLACK))
+PAWN_PUSHES = tuple(tuple(_mask((pos,)) if pos is not None else 0 for pos in PAWN_PUSH[color])
+                    for color in (WHITE, BLACK))
+# RAY_MASKS[direction][sq], so a slider's reach can be cut at its first blocker
+RAY_MASKS = tuple(tuple(_mask(RAYS[sq][d]) for sq in range(NUM_SQUARES))
+                  for d in range(len(DIRECTIONS)))
+# A direction is "positive" when it walks towards higher bits, so the nearest
+# blocker on the ray is its lowest set bit
+POSITIVE = tuple(d[0] * COL_SIZE + d[1] > 0 for d in DIRECTIONS)
+# Squares strictly between two aligned squares, 0 when they are not aligned
+BETWEEN = tuple(tuple(_mask(LINES[a][b][:-1]) for b in range(NUM_SQUARES))
+                for a in range(NUM_SQUARES))
@@ -0,0 +1,187 @@
+"""Self-play tournaments between MinimaxAgent configurations.
+
+Every pair of engines plays the same set of openings, each opening once with
+either engine as white, across a pool of processes. Engines are written as
+``name:setting=value,...`` with any of the MinimaxAgent settings in SETTINGS
+and ``eval`` naming one of EVAL_FUNCS::
+
+    python tournament.py --engine d3:depth=3 --engine d4:depth=4 --openings 50
+    python tournament.py --engine fast:time_ms=50 --engine slow:time_ms=200 --engine noq:time_ms=200,quiescence_plies=0
+
+Games are scored like Game.is_game_over, including the 50 move limit. The
+report gives each pair's Elo difference with a 95% error bar, and each engine's
+average time per move and nodes per second.
+"""
+import argparse
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import *
+from game import Game
+from agent import MinimaxAgent
+from evaluate import EVAL_FUNCS
+from bitboard import legal_moves
+from tables import WHITE, BLACK
+
+SETTINGS = ("depth", "time_ms", "node_limit", "tt_size", "quiescence_plies")
+
+
+def parse_engine(spec: str) -> dict:
+  """Read an engine written as name:setting=value,...
+
+  >>> parse_engine("fast:depth=3,time_ms=50")
+  {'name': 'fast', 'eval': 'basic_eval', 'depth': 3, 'time_ms': 50}
+  """
+  name, _, settings = spec.partition(":")
+  engine = {"name": name, "eval": "basic_eval"}
+  for setting in filter(None, settings.split(",")):
+    field, _, value = setting.partition("=")
+    if field == "eval":
+      if value not in EVAL_FUNCS:
+        raise ValueError(f"Unknown eval function {value}, expected one of {', '.join(EVAL_FUNCS)}")
+      engine["eval"] = value
+    elif field in SETTINGS:
+      engine[field] = int(value)
+    else:
+      raise ValueError(f"Unknown engine setting {field} in {spec}")
+  return engine
+
+
+def openings(count: int, plies: int, seed: int = 0) -> list[tuple[tuple[int, int], ...]]:
+  """count different random move sequences of plies plies from the start,
+  skipping any that end the game.
+  """
+  rng = random.Random(seed)
+  found = set()
+  for _ in range(count * 100):
+    if len(found) == count:
+      break
+    game = Game(None, None)
+    color = WHITE
+    moves = []
+    for ply in range(plies):
+      choices = legal_moves(game.board, color)
+      if len(choices) == 0:
+        break
+      move = rng.choice(choices)
+      game.board.push(move)
+      moves.append(move)
+      color = 1 - color
+    if len(moves) == plies and not game.is_game_over(color, plies)[0]:
+      found.add(tuple(moves))
+  return sorted(found)
+
+
+def play_game(white: dict, black: dict, opening: tuple[tuple[int, int], ...]) -> dict:
+  """Play one game from the opening and return white's score (1, 0.5 or 0),
+  the number of plies, and each side's search time, moves and nodes.
+  """
+  game = Game(None, None)
+  for move in opening:
+    game.board.push(move)
+  color = WHITE if len(opening) % 2 == 0 else BLACK
+  agents = []
+  for side, engine in ((WHITE, white), (BLACK, black)):
+    settings = {field: engine[field] for field in SETTINGS if field in engine}
+    agents.append(MinimaxAgent(side, game.board, EVAL_FUNCS[engine["eval"]], **settings))
+
+  stats = [{"seconds": 0.0, "moves": 0, "nodes": 0} for _ in agents]
+  plies = len(opening)
+  while True:
+    over, result = game.is_game_over(color, plies)
+    if over:
+      break
+    start = time.perf_counter()
+    _, curr_pos, new_pos = agents[color].get_move()
+    stats[color]["seconds"] += time.perf_counter() - start
+    stats[color]["moves"] += 1
+    stats[color]["nodes"] += agents[color].nodes
+    game.flask_move(curr_pos, new_pos)
+    plies += 1
+    color = 1 - color
+
+  score = {"White Wins": 1.0, "Black Wins": 0.0}.get(result, 0.5)
+  return {"score": score, "plies": plies, "white": stats[WHITE], "black": stats[BLACK]}
+
+
+def elo_difference(scores: Sequence[float]) -> tuple[float, float]:
+  """Elo difference implied by a series of game scores, with the half width of
+  its 95% confidence interval.
+
+  >>> elo_difference([1, 0.5, 0.5, 0])
+  (0.0, 296.6)
+  >>> round(elo_difference([1, 1, 1, 0.5] * 10)[0])
+  338
+  """
+  n = len(scores)
+  mean = sum(scores) / n
+  deviation = math.sqrt(sum((s - mean) ** 2 for s in scores) / n)
+  error = 1.96 * deviation / math.sqrt(n)
+
+  def elo(score: float) -> float:
+    # All wins or all losses are no evidence of an infinite difference
+    score = min(max(score, 0.5 / n), 1 - 0.5 / n)
+    return 400 * math.log10(score / (1 - score))
+
+  return (round(elo(mean), 1), round((elo(mean + error) - elo(mean - error)) / 2, 1))
+
+
+def run(engines: list[dict], opening_list: list, processes: Optional[int] = None) -> dict:
+  """Play every pair of engines over every opening with both colors.
+
+  Returns the scores of each pair, keyed by (first, second) names and from the
+  first engine's side, and each engine's totals over all its games.
+  """
+  games = []
+  for i, first in enumerate(engines):
+    for second in engines[i + 1:]:
+      for opening in opening_list:
+        games.append((first, second, opening))
+        games.append((second, first, opening))
+
+  pairs = {}
+  totals = {engine["name"]: {"seconds": 0.0, "moves": 0, "nodes": 0} for engine in engines}
+  with ProcessPoolExecutor(max_workers=processes) as executor:
+    futures = [executor.submit(play_game, white, black, opening) for white, black, opening in games]
+    for i, ((white, black, _), future) in enumerate(zip(games, futures)):
+      result = future.result()
+      for engine, side in ((white, "white"), (black, "black")):
+        for field, value in result[side].items():
+          totals[engine["name"]][field] += value
+      # Even games have the pair's first engine as white
+      if i % 2 == 0:
+        pairs.setdefault((white["name"], black["name"]), []).append(result["score"])
+      else:
+        pairs[(black["name"], white["name"])].append(1 - result["score"])
+  return {"pairs": pairs, "totals": totals}
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description="Play MicroChess engines against each other")
+  parser.add_argument("--engine", action="append", type=parse_engine, required=True,
+                      help="name:setting=value,... with settings from " + ", ".join(("eval",) + SETTINGS))
+  parser.add_argument("--openings", type=int, default=20, help="openings each pair plays with both colors")
+  parser.add_argument("--opening-plies", type=int, default=4, help="random plies in each opening")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--processes", type=int, default=os.cpu_count())
+  args = parser.parse_args()
+  if len(args.engine) < 2:
+    parser.error("need at least two engines")
+
+  start = time.perf_counter()
+  report = run(args.engine, openings(args.openings, args.opening_plies, args.seed), args.processes)
+  print(f"{sum(len(s) for s in report['pairs'].values())} games in {time.perf_counter() - start:.1f}s")
+  for (first, second), scores in report["pairs"].items():
+    wins, draws = scores.count(1.0), scores.count(0.5)
+    diff, margin = elo_difference(scores)
+    print(f"{first} vs {second}: +{wins} ={draws} -{len(scores) - wins - draws}, "
+          f"Elo {diff:+.0f} +/- {margin:.0f}")
+  for name, total in report["totals"].items():
+    per_move = total["seconds"] / max(total["moves"], 1)
+    print(f"{name}: {per_move * 1000:.1f} ms/move, {total['nodes'] / max(total['seconds'], 1e-9):.0f} nodes/sec")
+
+
+if __name__ == "__main__":
+  main()
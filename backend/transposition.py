@@ -0,0 +1,55 @@
+"""Fixed-size transposition table for the search.
+"""
+from typing import *
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class TranspositionTable:
+  """Hash table of search results keyed by Zobrist hash.
+
+  Each slot holds (key, depth, bound, score, best_move, generation). A slot is
+  overwritten when the new result is at least as deep, or when the stored one
+  was written by an earlier search, so deep entries survive within a search
+  and stale ones age out across searches.
+
+  >>> tt = TranspositionTable(4)
+  >>> tt.store(7, 3, EXACT, 12, (16, 4))
+  >>> tt.probe(7)
+  (7, 3, 0, 12, (16, 4), 0)
+  >>> tt.store(11, 1, EXACT, 5, None)
+  >>> tt.probe(11) is None and tt.probe(7) is not None
+  True
+  >>> tt.new_search()
+  >>> tt.store(11, 1, EXACT, 5, None)
+  >>> tt.probe(11)[3]
+  5
+  """
+
+  def __init__(self, size: int = 1 << 16) -> None:
+    if size & (size - 1):
+      raise ValueError("Transposition table size must be a power of two")
+    self.mask = size - 1
+    self.slots = [None] * size
+    self.generation = 0
+    self.hits = 0
+
+  def new_search(self) -> None:
+    self.generation += 1
+
+  def clear(self) -> None:
+    self.slots = [None] * (self.mask + 1)
+    self.generation = 0
+
+  def probe(self, key: int) -> Optional[tuple]:
+    entry = self.slots[key & self.mask]
+    if entry is not None and entry[0] == key:
+      self.hits += 1
+      return entry
+    return None
+
+  def store(self, key: int, depth: int, bound: int, score, best_move: Optional[tuple[int, int]]) -> None:
+    index = key & self.mask
+    entry = self.slots[index]
+    if entry is None or entry[0] == key or depth >= entry[1] or entry[5] != self.generation:
+      self.slots[index] = (key, depth, bound, score, best_move, self.generation)
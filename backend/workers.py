@@ -0,0 +1,108 @@
+"""AI searches run in a pool of worker processes.
+
+A search is CPU bound, so running it inside a request blocks a web worker and,
+because of the GIL, serializes with every other game's search. Instead the
+server sends the position to the pool packed into a few bytes (see position),
+and each worker rebuilds the board, searches it and sends back the move. The
+tablebase and opening book are loaded once per worker process; when a complete
+solve of the game (see solver) is on disk it replaces the tablebase, so every
+move is a lookup.
+
+A game's searches always go to the same worker, which keeps the game's
+transposition table between moves so later moves reuse earlier searches, as a
+MinimaxAgent kept for the whole game would.
+"""
+import os
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import *
+from game import Game
+from agent import MinimaxAgent
+from transposition import TranspositionTable
+from evaluate import basic_eval
+from tablebase import Tablebase
+from solver import Solution
+from book import OpeningBook
+from position import Position, unpack
+
+# Transposition tables a worker keeps, for its most recently searched games
+WORKER_GAMES = 64
+
+# Set in each worker by _init_worker
+_tablebase = None
+_book = None
+# Game id to its transposition table, least recently searched first
+_tables = OrderedDict()
+
+
+def _init_worker() -> None:
+  global _tablebase, _book
+  solution = Solution()
+  _tablebase = solution if len(solution) > 0 else Tablebase()
+  _book = OpeningBook()
+
+
+def game_table(game_id: str, size: int) -> TranspositionTable:
+  """The transposition table kept for game_id in this process, evicting the
+  least recently searched game's when more than WORKER_GAMES are kept.
+
+  >>> game_table("a", 4) is game_table("a", 4), game_table("b", 4) is game_table("a", 4)
+  (True, False)
+  """
+  table = _tables.get(game_id)
+  if table is None:
+    table = _tables[game_id] = TranspositionTable(size)
+    if len(_tables) > WORKER_GAMES:
+      _tables.popitem(last=False)
+  else:
+    _tables.move_to_end(game_id)
+  return table
+
+
+def search_position(packed: bytes, settings: dict, game_id: Optional[str] = None) -> tuple[tuple[int, int], tuple[int, int], Optional[dict]]:
+  """Search a packed Position and return the (from, to) positions of the chosen
+  move and the search's stats, which are None unless settings turn them on.
+
+  settings are keyword arguments for MinimaxAgent, such as depth and time_ms.
+  With a game_id the search reuses that game's transposition table.
+  """
+  game = Game(None, None)
+  color = game.load_position(unpack(packed))
+  if game_id is not None:
+    settings = {**settings, "tt": game_table(game_id, settings.get("tt_size", 1 << 16))}
+  agent = MinimaxAgent(color, game.board, basic_eval, tablebase=_tablebase, book=_book, **settings)
+  _, curr_pos, new_pos = agent.get_move()
+  return curr_pos, new_pos, agent.search_stats
+
+
+class SearchPool:
+  """A fixed set of worker processes that search positions in parallel.
+
+  Each worker is its own single process executor, so that a game id always
+  maps to the same one.
+  """
+
+  def __init__(self, processes: Optional[int] = None, **settings) -> None:
+    self.settings = settings
+    self.executors = [ProcessPoolExecutor(max_workers=1, initializer=_init_worker)
+                      for _ in range(processes or os.cpu_count() or 1)]
+    self.submitted = 0
+
+  def submit(self, position: Position, game_id: Optional[str] = None, stats: bool = False) -> Future:
+    """Start searching for the move in position; the future's result is the
+    (from, to) positions and, if stats is set, the search's stats.
+
+    Searches for the same game_id run in the same worker and share its
+    transposition table; without one the search starts from an empty table.
+    """
+    if game_id is None:
+      # Nothing to reuse, so spread these across the workers
+      self.submitted += 1
+      executor = self.executors[self.submitted % len(self.executors)]
+    else:
+      executor = self.executors[hash(game_id) % len(self.executors)]
+    return executor.submit(search_position, position.pack(), {**self.settings, "stats": stats}, game_id)
+
+  def shutdown(self) -> None:
+    for executor in self.executors:
+      executor.shutdown(cancel_futures=True)
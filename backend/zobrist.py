@@ -0,0 +1,22 @@
+"""Zobrist keys for hashing MicroChess positions.
+
+A position's hash is the XOR of one key per (piece, square) pair, so making or
+taking back a move only has to XOR in the handful of keys that changed. The
+keys come from a fixed seed, which keeps hashes stable between runs and lets
+them be written to disk.
+"""
+import random
+from tables import NUM_SQUARES
+
+_rng = random.Random(0x5EED)
+
+PIECE_KEYS = {char: tuple(_rng.getrandbits(64) for _ in range(NUM_SQUARES))
+              for char in "KQRBNPkqrbnp"}
+# XORed into a board's hash when black is the side to move
+BLACK_TO_MOVE = _rng.getrandbits(64)
+
+
+def side_key(board_hash: int, color: int) -> int:
+  """Combine a board hash with the side to move.
+  """
+  return board_hash ^ BLACK_TO_MOVE if color else board_hash
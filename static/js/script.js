@@ -1,5 +1,7 @@
 const board = document.querySelector(".board");
 let selectedPiece = null;
+// The server hosts many games at once; this tab's game id survives reloads
+let gameId = sessionStorage.getItem('gameId');
 
 const initialSetup = [
   ["king-b", "knight-b", "bishop-b", "rook-b"],
@@ -34,7 +36,14 @@ for (let i = 0; i < 5; i++) {
 
 window.onload = function() {
     fetch('http://localhost:5000/reset_game', {
-        method: 'POST'
+        method: 'POST',
+        headers: {
+            "Content-Type": "application/json",
+        },
+        body: JSON.stringify({
+            game_id: gameId,
+            is_1v1: !modeToggle.checked,
+        }),
     })
     .then(response => {
         if (!response.ok) {
@@ -46,6 +55,8 @@ window.onload = function() {
         if (data.message) {
             console.log(data.message);
         }
+        gameId = data.game_id;
+        sessionStorage.setItem('gameId', gameId);
     })
     .catch((error) => {
         console.error('Error:', error);
@@ -54,6 +65,16 @@ window.onload = function() {
 
 let legalMoves = [];  // New global variable to store legal moves
 
+// The server searches the computer's reply in the background; ask until it is ready
+async function fetchAiMove() {
+  while (true) {
+    const response = await fetch(`http://localhost:5000/ai_move?game_id=${gameId}`);
+    if (response.status !== 202) {
+      return response.ok ? await response.json() : null;
+    }
+  }
+}
+
 async function handleCellClick(event) {
   const row = parseInt(event.target.dataset.row_count, 10);
   const col = parseInt(event.target.dataset.col_count, 10);
@@ -63,7 +84,7 @@ async function handleCellClick(event) {
 
   if (!selectedPiece) {
     // Handle the click on a piece
-    const pieceResponse = await fetch(`http://localhost:5000/get_legal_moves/${row}/${col}`);
+    const pieceResponse = await fetch(`http://localhost:5000/get_legal_moves/${row}/${col}?game_id=${gameId}`);
 
     if (pieceResponse.status === 400) {
       alert('Wrong turn! Please choose a valid piece.');
@@ -99,6 +120,7 @@ async function handleCellClick(event) {
         "Content-Type": "application/json",
       },
       body: JSON.stringify({
+        game_id: gameId,
         old_coor: selectedPiece,
         new_coor: { row, col },
       }),
@@ -150,11 +172,12 @@ async function handleCellClick(event) {
 
       selectedPiece = null;
       legalMoves = [];
-      if (moveData.ai_move) {
+      const aiData = moveData.ai_pending ? await fetchAiMove() : null;
+      if (aiData && aiData.ai_move) {
       console.log("157");
         // If AI's king is in check, make it glow pink for half a second
-        if (moveData.ai_in_check) {
-        const kingCell = document.querySelector(`[data-row_count='${moveData.ai_king_position[0]}'][data-col_count='${moveData.ai_king_position[1]}']`);
+        if (aiData.ai_in_check) {
+        const kingCell = document.querySelector(`[data-row_count='${aiData.ai_king_position[0]}'][data-col_count='${aiData.ai_king_position[1]}']`);
         kingCell.style.backgroundColor = 'pink';
         kingCell.classList.add('in-check');
         console.log("This line is being executed");
@@ -162,8 +185,8 @@ async function handleCellClick(event) {
         }
 
         // Make the AI's move after highlighting in_check (if applicable)
-        const aiOldCoor = moveData.ai_move.old_coor;
-        const aiNewCoor = moveData.ai_move.new_coor;
+        const aiOldCoor = aiData.ai_move.old_coor;
+        const aiNewCoor = aiData.ai_move.new_coor;
 
         const aiOldPieceCell = document.querySelector(`[data-row_count='${aiOldCoor.row}'][data-col_count='${aiOldCoor.col}']`);
         const aiNewPieceCell = document.querySelector(`[data-row_count='${aiNewCoor.row}'][data-col_count='${aiNewCoor.col}']`);
@@ -188,12 +211,12 @@ async function handleCellClick(event) {
         }
 
         // Handle game_over logic for AI's move
-        if (moveData.ai_game_over) {
-        const kingCell = document.querySelector(`[data-row_count='${moveData.white_king_position[0]}'][data-col_count='${moveData.white_king_position[1]}']`);
+        if (aiData.ai_game_over) {
+        const kingCell = document.querySelector(`[data-row_count='${aiData.white_king_position[0]}'][data-col_count='${aiData.white_king_position[1]}']`);
         kingCell.style.backgroundColor = 'red';
 
         setTimeout(() => {
-          alert(moveData.result_message);
+          alert(aiData.result_message);
           location.reload();
         }, 50);
         return;
@@ -228,7 +251,7 @@ modeToggle.addEventListener('change', function() {
     updateModeText();  // Update mode text based on changed toggle state
 
     // Change the game mode on the server when the toggle is clicked
-    fetch('http://localhost:5000/change_mode')
+    fetch(`http://localhost:5000/change_mode?game_id=${gameId}`)
     .then(response => {
         if (!response.ok) {
             throw new Error('Network response was not ok');